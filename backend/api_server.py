@@ -1,15 +1,21 @@
 # backend/api_server.py
 
+import gzip
+import hashlib
 import os
-import sqlite3
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from flask import Flask, jsonify, request, Response
+from flask import Flask, jsonify, request, Response, stream_with_context
 
 from dotenv import load_dotenv
 from web3 import Web3
 
-from db import MonitorDatabase
+from db import ROLLUP_METRICS, ROLLUP_RESOLUTIONS, ReadOnlyDatabase, pick_rollup_resolution
 from config import load_risk_monitor_contract
+from market_loader import load_markets
+from onchain_cache import OnchainRiskCache
+from risk_stream import RiskStreamHub, format_sse, level_row_to_item, normalize_market_id
 
 # -------------------------------------------------------------------
 # 基础路径 / DB / 前端路径
@@ -23,6 +29,80 @@ INDEX_PATH = FRONTEND_DIR / "index.html"
 
 app = Flask(__name__)
 
+# 所有请求线程共用一个只读连接池：最多 READ_DB_POOL_SIZE 条连接，每次查询借出、用完归还，
+# 并发查询超过这个数时排队等待空闲连接
+READ_DB_POOL_SIZE = int(os.getenv("READ_DB_POOL_SIZE", "8"))
+read_db = ReadOnlyDatabase(DB_PATH, pool_size=READ_DB_POOL_SIZE)
+
+# 固定 SQL 文本，sqlite3 的语句缓存会复用编译结果
+SQL_RISK_COUNT = "SELECT COUNT(*) FROM risk_levels"
+# 全部按自增 id 排序 / 翻页：走 rowid 或 (market_id, id) 索引，不用按 created_at 排序
+SQL_RISK_LAST = """
+    SELECT created_at, market_id, level, source
+    FROM risk_levels
+    ORDER BY id DESC
+    LIMIT 1
+"""
+SQL_RISK_RECENT = """
+    SELECT id, created_at, market_id, level, source
+    FROM risk_levels
+    ORDER BY id DESC LIMIT ?
+"""
+SQL_RISK_RECENT_BY_MARKET = """
+    SELECT id, created_at, market_id, level, source
+    FROM risk_levels
+    WHERE market_id = ?
+    ORDER BY id DESC LIMIT ?
+"""
+SQL_RISK_SINCE = """
+    SELECT id, created_at, market_id, level, source
+    FROM risk_levels
+    WHERE id > ?
+    ORDER BY id LIMIT ?
+"""
+SQL_RISK_SINCE_BY_MARKET = """
+    SELECT id, created_at, market_id, level, source
+    FROM risk_levels
+    WHERE market_id = ? AND id > ?
+    ORDER BY id LIMIT ?
+"""
+# 表的“版本号”：最新一行的 id，用来生成 ETag
+SQL_RISK_HEAD = """
+    SELECT id
+    FROM risk_levels
+    ORDER BY id DESC
+    LIMIT 1
+"""
+SQL_RISK_HEAD_BY_MARKET = """
+    SELECT id
+    FROM risk_levels
+    WHERE market_id = ?
+    ORDER BY id DESC
+    LIMIT 1
+"""
+
+# 降采样序列：按 (market_id, resolution, bucket_start) 主键范围扫描
+SQL_RISK_SERIES = f"""
+    SELECT
+        bucket_start,
+        level_samples,
+        level_max,
+        level_last,
+        metric_samples,
+        {", ".join(f"{m}_sum, {m}_max" for m in ROLLUP_METRICS)}
+    FROM risk_rollups
+    WHERE market_id = ? AND resolution = ? AND bucket_start >= ? AND bucket_start < ?
+    ORDER BY bucket_start
+"""
+
+RISK_MAX_LIMIT = 5000
+SERIES_DEFAULT_SPAN = 24 * 60 * 60
+SERIES_DEFAULT_POINTS = 500
+SERIES_MAX_POINTS = 2000
+# 响应体超过这个字节数且客户端支持时才 gzip
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+
 # -------------------------------------------------------------------
 # 链上合约配置：读取真实 level
 # -------------------------------------------------------------------
@@ -47,6 +127,50 @@ MARKET_ID_HEX = Web3.to_hex(MARKET_ID_BYTES)
 # 初始化 Web3 + 风险监控合约（只读调用）
 w3, risk_contract = load_risk_monitor_contract(RISK_NETWORK)
 
+# 链上 markets[marketId] 的服务端缓存，按 RiskUpdated 事件失效 / 更新
+onchain_cache = OnchainRiskCache(w3, risk_contract)
+
+# SSE 推送：新写入的风险行 + 链上等级变化
+stream_hub = RiskStreamHub(read_db)
+
+
+def _publish_onchain_change(market_id: bytes, entry: dict):
+    stream_hub.publish(
+        "onchain",
+        {
+            "market_id": Web3.to_hex(market_id),
+            "level": entry["level"],
+            "last_update": entry["last_update"],
+        },
+        market_id=Web3.to_hex(market_id),
+    )
+
+
+onchain_cache.add_listener(_publish_onchain_change)
+
+
+def dex_market_labels() -> list[str]:
+    """markets.json 里所有 dex_pool 的 label，markets=all 时使用。"""
+    return [m["label"] for m in load_markets() if m.get("type") == "dex_pool" and m.get("label")]
+
+
+def onchain_market_payload(label: str) -> dict:
+    market_id = calc_market_id(label)
+    m = onchain_cache.get(market_id)
+    payload = {
+        "ok": m["exists"],
+        "exists": m["exists"],
+        "market_label": label,
+        "market_id": Web3.to_hex(market_id),
+    }
+    if not m["exists"]:
+        payload["message"] = "Market not registered on-chain"
+        return payload
+
+    payload["level"] = m["level"]
+    payload["last_update"] = m["last_update"]  # 区块时间（秒级 Unix 时间戳）
+    return payload
+
 
 # ==================== 路由：前端 ====================
 
@@ -67,26 +191,14 @@ def index():
 @app.route("/api/status")
 def api_status():
     try:
-        if not DB_PATH.exists():
+        if not read_db.exists():
             return jsonify({
                 "ok": False,
                 "message": "数据库文件不存在，请先运行 monitor.py 生成数据"
             }), 200
 
-        db = MonitorDatabase(DB_PATH)
-        cur = db.conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM risk_levels")
-        count = cur.fetchone()[0] or 0
-
-        cur.execute(
-            """
-            SELECT created_at, market_id, level, source
-            FROM risk_levels
-            ORDER BY created_at DESC
-            LIMIT 1
-            """
-        )
-        row = cur.fetchone()
+        count = read_db.query_one(SQL_RISK_COUNT)[0] or 0
+        row = read_db.query_one(SQL_RISK_LAST)
         last_record = None
         if row:
             last_record = {
@@ -101,47 +213,169 @@ def api_status():
         return jsonify({"ok": False, "message": f"后端异常: {e}"}), 500
 
 
+@app.after_request
+def gzip_large_json(response):
+    """大于 GZIP_MIN_BYTES 的 JSON 响应按 Accept-Encoding 压缩（SSE 流不处理）。"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.mimetype != "application/json"
+        or "Content-Encoding" in response.headers
+        or "gzip" not in request.headers.get("Accept-Encoding", "").lower()
+    ):
+        return response
+
+    body = response.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return response
+
+    response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
 @app.route("/api/risk")
 def api_risk():
     """
     本地 SQLite 中的历史风险点，用于画时间序列图
-    """
-    limit = int(request.args.get("limit", 100))
-    market = request.args.get("market")
 
-    base_sql = """
-        SELECT created_at, market_id, level, source
-        FROM risk_levels
+    - ?limit=N：最新 N 条（按时间正序返回）
+    - ?since_id=ID（或 ?cursor=ID）：只返回 id > ID 的行，按 id 正序分页，
+      has_more 为真时用 next_cursor 继续取
+    - ?market=ID（或 ?market_id=ID，带不带 0x 都行）：只看某个市场
+    表没有前进时按 If-None-Match 返回 304。
+    不发 Last-Modified：created_at 只精确到秒，同一秒内写入的新行会被 If-Modified-Since 误判成未修改。
     """
-    params = []
-    if market:
-        base_sql += " WHERE market_id = ?"
-        params.append(market)
+    try:
+        limit = int(request.args.get("limit", 100))
+        since_arg = request.args.get("since_id") or request.args.get("cursor")
+        since_id = int(since_arg) if since_arg else None
+    except ValueError:
+        return jsonify({"ok": False, "message": "limit / since_id 必须是整数", "items": []}), 400
+    if since_id is not None and since_id < 0:
+        return jsonify({"ok": False, "message": "since_id 不能为负数", "items": []}), 400
+    limit = max(1, min(limit, RISK_MAX_LIMIT))
+    market = normalize_market_id(request.args.get("market_id") or request.args.get("market"))
+
+    try:
+        if market:
+            head = read_db.query_one(SQL_RISK_HEAD_BY_MARKET, (market,))
+        else:
+            head = read_db.query_one(SQL_RISK_HEAD)
+        head_id = head[0] if head else 0
+
+        # ETag 由表头 id 和查询参数决定：没有新行写入就不会变
+        query_key = f"{market or ''}|{since_id}|{limit}"
+        etag = f"risk-{head_id}-" + hashlib.blake2s(query_key.encode(), digest_size=6).hexdigest()
+
+        if request.if_none_match.contains_weak(etag):
+            not_modified = Response(status=304)
+            not_modified.set_etag(etag, weak=True)
+            return not_modified
+
+        if since_id is not None:
+            if market:
+                rows = read_db.query(SQL_RISK_SINCE_BY_MARKET, (market, since_id, limit))
+            else:
+                rows = read_db.query(SQL_RISK_SINCE, (since_id, limit))
+            has_more = len(rows) == limit
+        else:
+            # 先按 id 倒序取最新 N 条，再反转成正序，方便前端画图
+            if market:
+                rows = read_db.query(SQL_RISK_RECENT_BY_MARKET, (market, limit))
+            else:
+                rows = read_db.query(SQL_RISK_RECENT, (limit,))
+            rows.reverse()
+            has_more = False
+
+        data = [level_row_to_item(r) for r in rows]
+        next_cursor = rows[-1][0] if rows else (since_id if since_id is not None else head_id)
+
+        resp = jsonify({"ok": True, "items": data, "next_cursor": next_cursor, "has_more": has_more})
+        resp.set_etag(etag, weak=True)
+        # 允许浏览器缓存，但每次都要带条件请求回来校验
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp, 200
+    except Exception as e:
+        return jsonify({
+            "ok": False,
+            "message": f"查询失败: {e}",
+            "items": []
+        }), 500
 
-    # 关键：先按时间倒序取最新 N 条
-    base_sql += " ORDER BY created_at DESC LIMIT ?"
-    params.append(limit)
 
+def _series_row_to_item(row: tuple, resolution: int) -> dict:
+    bucket_start, level_samples, level_max, level_last, metric_samples = row[:5]
+    item = {
+        "bucket_start": bucket_start,
+        "time": datetime.fromtimestamp(bucket_start, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "resolution": resolution,
+        "level_samples": level_samples,
+        "level_max": level_max,
+        "level_last": level_last,
+        "metric_samples": metric_samples,
+    }
+    values = row[5:]
+    for i, name in enumerate(ROLLUP_METRICS):
+        total, peak = values[2 * i], values[2 * i + 1]
+        item[f"{name}_mean"] = total / metric_samples if metric_samples and total is not None else None
+        item[f"{name}_max"] = peak
+    return item
+
+
+@app.route("/api/risk/series")
+def api_risk_series():
+    """
+    长时间跨度的降采样序列（来自 risk_rollups，监控写入时增量维护）
+
+    - ?market=ID：市场，默认最近一条风险记录所在的市场
+    - ?from=TS&to=TS（UTC Unix 秒）或 ?span=秒：时间范围，默认最近 24h
+    - ?points=N：最多返回多少个桶，按跨度自动挑 1m / 15m / 1h / 1d 分辨率
+    - ?resolution=秒：强制指定分辨率（必须是 ROLLUP_RESOLUTIONS 之一）
+    每个桶：等级最大值 / 最后值，各因子均值与最大值。
+    """
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        cur.execute(base_sql, params)
-        rows = cur.fetchall()
-        conn.close()
-
-        # 再反转一次，让结果按时间正序返回，方便前端画图
-        rows.reverse()
-
-        data = [
-            {
-                "created_at": r[0],
-                "market_id": r[1],
-                "level": r[2],
-                "source": r[3],
-            }
-            for r in rows
-        ]
-        return jsonify({"ok": True, "items": data}), 200
+        now = int(time.time())
+        to_ts = int(request.args.get("to", now))
+        if request.args.get("from"):
+            from_ts = int(request.args["from"])
+        else:
+            from_ts = to_ts - int(request.args.get("span", SERIES_DEFAULT_SPAN))
+        if from_ts >= to_ts:
+            return jsonify({"ok": False, "message": "from 必须早于 to", "items": []}), 400
+
+        points = max(1, min(int(request.args.get("points", SERIES_DEFAULT_POINTS)), SERIES_MAX_POINTS))
+        if request.args.get("resolution"):
+            resolution = int(request.args["resolution"])
+            if resolution not in ROLLUP_RESOLUTIONS:
+                return jsonify({
+                    "ok": False,
+                    "message": f"resolution 只支持 {list(ROLLUP_RESOLUTIONS)}",
+                    "items": [],
+                }), 400
+        else:
+            resolution = pick_rollup_resolution(to_ts - from_ts, points)
+
+        market = request.args.get("market")
+        if not market:
+            last = read_db.query_one(SQL_RISK_LAST)
+            if not last:
+                return jsonify({"ok": True, "resolution": resolution, "items": []}), 200
+            market = last[1]
+
+        # 起点对齐到桶边界，第一个桶不会被截掉一半
+        bucket_from = from_ts - from_ts % resolution
+        rows = read_db.query(SQL_RISK_SERIES, (market, resolution, bucket_from, to_ts))
+
+        return jsonify({
+            "ok": True,
+            "market_id": market,
+            "from": bucket_from,
+            "to": to_ts,
+            "resolution": resolution,
+            "items": [_series_row_to_item(r, resolution) for r in rows],
+        }), 200
     except Exception as e:
         return jsonify({
             "ok": False,
@@ -155,31 +389,24 @@ def api_onchain_risk():
     """
     读取链上合约 RiskMonitor.markets[marketId] 的真实 level
     用于驱动前端的 🚥 风险灯
+
+    - 不带参数：默认 MARKET_LABEL，返回单个市场（兼容旧前端）
+    - ?market=LABEL：指定单个市场
+    - ?markets=L1,L2 或 ?markets=all：批量返回 {"ok": true, "items": [...]}
+    结果来自服务端缓存，新区块里出现 RiskUpdated 事件才会变化。
     """
     try:
-        # struct MarketRisk { uint8 level; uint256 lastUpdate; bool exists; }
-        m = risk_contract.functions.markets(MARKET_ID_BYTES).call()
-        level = int(m[0])
-        last_update = int(m[1])
-        exists = bool(m[2])
-
-        if not exists:
-            return jsonify({
-                "ok": False,
-                "exists": False,
-                "message": "Market not registered on-chain",
-                "market_label": MARKET_LABEL,
-                "market_id": MARKET_ID_HEX,
-            }), 200
-
-        return jsonify({
-            "ok": True,
-            "exists": True,
-            "market_label": MARKET_LABEL,
-            "market_id": MARKET_ID_HEX,
-            "level": level,
-            "last_update": last_update,  # 区块时间（秒级 Unix 时间戳）
-        }), 200
+        markets_arg = request.args.get("markets")
+        if markets_arg:
+            if markets_arg == "all":
+                labels = dex_market_labels()
+            else:
+                labels = [x.strip() for x in markets_arg.split(",") if x.strip()]
+            items = [onchain_market_payload(label) for label in labels]
+            return jsonify({"ok": True, "items": items}), 200
+
+        label = request.args.get("market") or MARKET_LABEL
+        return jsonify(onchain_market_payload(label)), 200
 
     except Exception as e:
         return jsonify({
@@ -188,6 +415,44 @@ def api_onchain_risk():
         }), 500
 
 
+@app.route("/api/stream")
+def api_stream():
+    """
+    SSE 推送通道，前端首次加载后用 EventSource 订阅增量：
+      event: risk     -> 新的 risk_levels 行（SSE id = risk_levels.id）
+      event: metrics  -> 新的 risk_metrics 行（大整数为字符串）
+      event: onchain  -> 链上 RiskUpdated 带来的等级变化
+    断线重连时浏览器自动带 Last-Event-ID，服务端补发之后的 risk 行。
+    ?market_id=ID：只推这个市场的事件（补发同样只含这个市场）。
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("since_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    market = normalize_market_id(request.args.get("market_id") or request.args.get("market"))
+
+    initial = []
+    try:
+        # 先推一次默认市场的链上快照（订阅了别的市场时不推）；顺便拉起链上事件扫描线程
+        snapshot = onchain_market_payload(MARKET_LABEL)
+        if market is None or normalize_market_id(snapshot["market_id"]) == market:
+            initial.append(format_sse("onchain", snapshot))
+    except Exception as e:
+        print(f"⚠️ 读取链上快照失败: {e}")
+
+    return Response(
+        stream_with_context(stream_hub.stream(last_event_id, initial, market)),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 if __name__ == "__main__":
     # 默认端口 8000
-    app.run(host="0.0.0.0", port=8000, debug=True)
\ No newline at end of file
+    # SSE 长连接需要多线程处理请求
+    app.run(host="0.0.0.0", port=8000, debug=True, threaded=True)
\ No newline at end of file
@@ -1,6 +1,11 @@
-from typing import List, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
 from web3 import Web3
-from config import make_web3
+from config import make_web3, get_rpc_session
+from lru import LRU
+from trades import TradeBatch
 
 UNISWAP_V2_PAIR_ABI = [
     {
@@ -15,58 +20,288 @@ UNISWAP_V2_PAIR_ABI = [
         ],
         "name": "Swap",
         "type": "event",
-    }
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": False, "internalType": "uint112", "name": "reserve0", "type": "uint112"},
+            {"indexed": False, "internalType": "uint112", "name": "reserve1", "type": "uint112"},
+        ],
+        "name": "Sync",
+        "type": "event",
+    },
 ]
 
+SWAP_TOPIC0 = bytes(Web3.keccak(text="Swap(address,uint256,uint256,uint256,uint256,address)"))
+SYNC_TOPIC0 = bytes(Web3.keccak(text="Sync(uint112,uint112)"))
+
+# ----------------------------------------------------------------------
+# 区块时间戳解析：去重 + JSON-RPC 批量请求 + LRU 缓存
+# ----------------------------------------------------------------------
+
+# 一次 JSON-RPC batch 里最多放多少个 eth_getBlockByNumber
+BLOCK_BATCH_SIZE = 100
+# 批量请求不可用时，退化为有界线程池并发拉取
+BLOCK_FETCH_WORKERS = 8
+# 最近见过的区块时间戳（blocks_back=2000 的窗口足够放得下）
+BLOCK_TS_CACHE_SIZE = 4096
+
+# (network, block_number) -> timestamp
+_block_ts_cache: LRU = LRU(maxsize=BLOCK_TS_CACHE_SIZE)
+# 多个因子线程（以及超时后还在跑的线程）会同时读写缓存；只在查 / 写时持锁，不包住 RPC
+_block_ts_lock = threading.Lock()
+
+
+def _fetch_block_timestamps_batch(
+    w3: Web3,
+    block_numbers: List[int],
+    network: str,
+) -> Dict[int, int]:
+    """
+    直接对 HTTP 节点发 JSON-RPC batch，每 BLOCK_BATCH_SIZE 个区块一次往返。
+    只取区块头（第二个参数 False，不带交易列表）。
+    """
+    endpoint = getattr(w3.provider, "endpoint_uri", None)
+    if not endpoint:
+        raise RuntimeError("当前 provider 不支持 JSON-RPC batch")
+    session = get_rpc_session(network)
+
+    result: Dict[int, int] = {}
+    for i in range(0, len(block_numbers), BLOCK_BATCH_SIZE):
+        chunk = block_numbers[i:i + BLOCK_BATCH_SIZE]
+        payload = [
+            {
+                "jsonrpc": "2.0",
+                "id": n,
+                "method": "eth_getBlockByNumber",
+                "params": [hex(n), False],
+            }
+            for n in chunk
+        ]
+        resp = session.post(str(endpoint), json=payload, timeout=30)
+        resp.raise_for_status()
+        replies = resp.json()
+        if not isinstance(replies, list):
+            raise RuntimeError(f"节点不支持 batch 请求: {replies}")
+
+        for r in replies:
+            block = r.get("result")
+            if not block:
+                raise RuntimeError(f"eth_getBlockByNumber 失败: {r.get('error')}")
+            result[int(r["id"])] = int(block["timestamp"], 16)
+    return result
+
+
+def _fetch_block_timestamps_pooled(w3: Web3, block_numbers: List[int]) -> Dict[int, int]:
+    """batch 不可用时的兜底：有界线程池并发 get_block。"""
+    def _one(n: int) -> int:
+        return int(w3.eth.get_block(n)["timestamp"])
+
+    with ThreadPoolExecutor(max_workers=BLOCK_FETCH_WORKERS) as pool:
+        timestamps = list(pool.map(_one, block_numbers))
+    return dict(zip(block_numbers, timestamps))
+
+
+def resolve_block_timestamps(
+    w3: Web3,
+    block_numbers: Iterable[int],
+    network: str = "mainnet",
+) -> Dict[int, int]:
+    """
+    把一批区块号解析成 {block_number: timestamp}。
+    - 先去重，再查 LRU 缓存
+    - 缓存未命中的区块走 JSON-RPC batch；节点不支持时退化为线程池
+    """
+    unique = sorted({int(n) for n in block_numbers})
+    timestamps: Dict[int, int] = {}
+    missing: List[int] = []
+
+    with _block_ts_lock:
+        for n in unique:
+            ts = _block_ts_cache.get((network, n))
+            if ts is None:
+                missing.append(n)
+            else:
+                timestamps[n] = ts
+
+    if missing:
+        try:
+            fetched = _fetch_block_timestamps_batch(w3, missing, network)
+        except Exception as e:
+            print(f"⚠️ 批量获取区块头失败，改用线程池逐个获取: {e}")
+            fetched = _fetch_block_timestamps_pooled(w3, missing)
+
+        with _block_ts_lock:
+            for n, ts in fetched.items():
+                _block_ts_cache[(network, n)] = ts
+        timestamps.update(fetched)
+
+    return timestamps
+
+
+# ----------------------------------------------------------------------
+# Swap / Sync 原始日志快速解码：data 是定长 uint256 字，直接按 32 字节切片
+# ----------------------------------------------------------------------
+
+def _log_data_bytes(data: Any) -> bytes:
+    if isinstance(data, str):
+        return bytes.fromhex(data[2:] if data.startswith("0x") else data)
+    return bytes(data)
+
+
+def decode_swap_logs(logs: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    把一批 Swap 原始日志解码成列式结构（每列一个 list，行号一一对应）：
+      block_number / log_index / tx_hash / amount0_in / amount1_in / amount0_out / amount1_out
+    data 固定是 4 个 uint256 = 128 字节，用 memoryview + int.from_bytes 直接切，
+    不经过 web3 的 ABI 解码和 AttributeDict。
+    """
+    cols: Dict[str, List[Any]] = {
+        "block_number": [],
+        "log_index": [],
+        "tx_hash": [],
+        "amount0_in": [],
+        "amount1_in": [],
+        "amount0_out": [],
+        "amount1_out": [],
+    }
+    from_bytes = int.from_bytes
+
+    for log in logs:
+        mv = memoryview(_log_data_bytes(log["data"]))
+        if len(mv) < 128:
+            continue
+        cols["block_number"].append(int(log["blockNumber"]))
+        cols["log_index"].append(int(log["logIndex"]))
+        cols["tx_hash"].append(log["transactionHash"].hex())
+        cols["amount0_in"].append(from_bytes(mv[0:32], "big"))
+        cols["amount1_in"].append(from_bytes(mv[32:64], "big"))
+        cols["amount0_out"].append(from_bytes(mv[64:96], "big"))
+        cols["amount1_out"].append(from_bytes(mv[96:128], "big"))
+    return cols
+
+
+def decode_transfer_logs(
+    logs: List[Dict[str, Any]],
+    intern: Optional[Dict[bytes, bytes]] = None,
+) -> Dict[str, List[Any]]:
+    """
+    批量解码 ERC20 Transfer(address indexed from, address indexed to, uint256 value)，列式返回：
+      from / to : 20 字节地址（bytes），经 intern 字典去重，同一地址始终是同一个对象
+      value     : 精确的 int
+    先把 topics[1] / topics[2] / data 各自拼成连续的字节缓冲区，再按固定偏移切片，
+    不经过 hex 字符串。topic 数不是 3 或 data 不是 32 字节的日志（如 ERC721）跳过。
+    """
+    if intern is None:
+        intern = {}
+
+    topics1: List[bytes] = []
+    topics2: List[bytes] = []
+    datas: List[bytes] = []
+    for log in logs:
+        topics = log.get("topics") or []
+        if len(topics) != 3:
+            continue
+        data = _log_data_bytes(log.get("data") or b"")
+        if len(data) != 32:
+            continue
+        topics1.append(bytes(topics[1]))
+        topics2.append(bytes(topics[2]))
+        datas.append(data)
+
+    n = len(datas)
+    from_buf = memoryview(b"".join(topics1))
+    to_buf = memoryview(b"".join(topics2))
+    data_buf = memoryview(b"".join(datas))
+    from_bytes = int.from_bytes
+    setdefault = intern.setdefault
+
+    # 地址在 32 字节 topic 的后 20 字节
+    from_keys = [bytes(from_buf[o + 12:o + 32]) for o in range(0, n * 32, 32)]
+    to_keys = [bytes(to_buf[o + 12:o + 32]) for o in range(0, n * 32, 32)]
+    return {
+        "from": [setdefault(k, k) for k in from_keys],
+        "to": [setdefault(k, k) for k in to_keys],
+        "value": [from_bytes(data_buf[o:o + 32], "big") for o in range(0, n * 32, 32)],
+    }
+
+
+def decode_sync_log(log: Dict[str, Any]) -> Tuple[int, int]:
+    """Sync(uint112 reserve0, uint112 reserve1)：两个 32 字节字。"""
+    mv = memoryview(_log_data_bytes(log["data"]))
+    return int.from_bytes(mv[0:32], "big"), int.from_bytes(mv[32:64], "big")
+
 
 def fetch_recent_swaps(
     pair_address: str,
     blocks_back: int = 2000,
     network: str = "mainnet",
-) -> List[Dict[str, Any]]:
+) -> TradeBatch:
     w3 = make_web3(network)
-    pair = w3.eth.contract(address=Web3.to_checksum_address(pair_address), abi=UNISWAP_V2_PAIR_ABI)
-
     latest = w3.eth.block_number
     from_block = max(0, latest - blocks_back)
-    to_block = latest
-
-    swap_event = pair.events.Swap()
-    logs = swap_event.get_logs(fromBlock=from_block, toBlock=to_block)
-
-    trades: List[Dict[str, Any]] = []
-    for ev in logs:
-        args = ev["args"]
-        amount0_in = int(args["amount0In"])
-        amount1_in = int(args["amount1In"])
-        amount0_out = int(args["amount0Out"])
-        amount1_out = int(args["amount1Out"])
-
-        if amount0_in > 0:
-            token_in = "token0"
-            token_out = "token1"
-            amount_in = amount0_in
-            amount_out = amount1_out
-        else:
-            token_in = "token1"
-            token_out = "token0"
-            amount_in = amount1_in
-            amount_out = amount0_out
-
-        block = w3.eth.get_block(ev["blockNumber"])
-        trades.append(
-            {
-                "timestamp": block["timestamp"],
-                "block_number": ev["blockNumber"],
-                "tx_hash": ev["transactionHash"].hex(),
-                "token_in": token_in,
-                "token_out": token_out,
-                "amount_in": amount_in,
-                "amount_out": amount_out,
-                "gas_used": 0,
-                "gas_price": 0,
-            }
-        )
+    return fetch_swaps_range(pair_address, from_block, latest, network=network)
 
-    print(f"✅ 抓取到 {len(trades)} 笔 Swap 交易")
+
+def fetch_swaps_range(
+    pair_address: str,
+    from_block: int,
+    to_block: int,
+    network: str = "mainnet",
+) -> TradeBatch:
+    """抓取 [from_block, to_block] 区间内的 Swap，供增量游标按需拉取新区块。"""
+    trades, _ = fetch_pair_logs_range(pair_address, from_block, to_block, network=network)
     return trades
+
+
+def fetch_pair_logs_range(
+    pair_address: str,
+    from_block: int,
+    to_block: int,
+    network: str = "mainnet",
+) -> Tuple[TradeBatch, List[Dict[str, Any]]]:
+    """
+    一次 eth_getLogs 同时拿 Swap 和 Sync 两种事件。
+    返回 (trades, reserves)：
+      - trades: 列式的 TradeBatch，每笔 Swap 一行
+      - reserves: 每个区块最后一个 Sync 的 (reserve0, reserve1)，即该区块结束时池子的储备
+    """
+    w3 = make_web3(network)
+    logs = w3.eth.get_logs(
+        {
+            "address": Web3.to_checksum_address(pair_address),
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "topics": [[SWAP_TOPIC0, SYNC_TOPIC0]],
+        }
+    )
+
+    swap_logs = []
+    # block_number -> (log_index, reserve0, reserve1)
+    last_sync: Dict[int, Tuple[int, int, int]] = {}
+    for log in logs:
+        topic0 = bytes(log["topics"][0])
+        if topic0 == SWAP_TOPIC0:
+            swap_logs.append(log)
+        elif topic0 == SYNC_TOPIC0:
+            block_number = int(log["blockNumber"])
+            log_index = int(log["logIndex"])
+            prev = last_sync.get(block_number)
+            if prev is None or log_index > prev[0]:
+                reserve0, reserve1 = decode_sync_log(log)
+                last_sync[block_number] = (log_index, reserve0, reserve1)
+
+    swaps = decode_swap_logs(swap_logs)
+    block_ts = resolve_block_timestamps(w3, swaps["block_number"], network=network)
+    trades = TradeBatch.from_swap_columns(swaps, block_ts)
+
+    reserves = [
+        {"block_number": b, "reserve0": r0, "reserve1": r1}
+        for b, (_, r0, r1) in sorted(last_sync.items())
+    ]
+
+    print(
+        f"✅ 抓取到 {len(trades)} 笔 Swap 交易（涉及 {len(block_ts)} 个区块），"
+        f"{len(reserves)} 个区块的 Sync 储备"
+    )
+    return trades, reserves
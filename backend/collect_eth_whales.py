@@ -8,13 +8,17 @@ from __future__ import annotations
     python collect_eth_whales.py
     python collect_eth_whales.py --token <ERC20地址> --top 20 --blocks 200000
 
+扫描进度按区间保存在 whale_scan.db：中断后重跑会接着扫，之后再跑只补扫新区块，
+窗口起点之前的旧区间自动移除（滚动窗口排名）。--fresh 忽略检查点从头扫描。
+
 依赖：
     pip install python-dotenv web3
 """
 
 import argparse
+import bisect
+import heapq
 import json
-import os
 import time
 from pathlib import Path
 from typing import Dict, List, Any, Tuple
@@ -22,6 +26,12 @@ from typing import Dict, List, Any, Tuple
 from dotenv import load_dotenv
 from web3 import Web3
 
+from chain_data import decode_transfer_logs
+from config import make_web3
+from log_scanner import SCAN_WORKERS, scan_log_ranges
+from market_loader import atomic_write_json, markets_file_lock
+from whale_store import WHALE_SCAN_DB_PATH, WhaleScanStore, plan_missing_ranges
+
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -30,20 +40,9 @@ MARKETS_PATH = BASE_DIR / "markets.json"
 # 默认监控 token：主网 WETH
 DEFAULT_WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
 
-# 读取 mainnet RPC（你已经在 .env 里配了 ETH_RPC_URL，这里一并支持）
-MAINNET_RPC = (
-    os.getenv("MAINNET_RPC")
-    or os.getenv("ETH_RPC_URL")
-    or os.getenv("MAINNET_HTTP_URL")
-    or os.getenv("ALCHEMY_MAINNET_RPC")
-)
-
-if not MAINNET_RPC:
-    raise RuntimeError(
-        "请在 .env 中配置 MAINNET_RPC / ETH_RPC_URL / MAINNET_HTTP_URL / ALCHEMY_MAINNET_RPC 之一"
-    )
-
-w3 = Web3(Web3.HTTPProvider(MAINNET_RPC))
+# 复用 config 里按网络缓存的连接池；mainnet 依次读取
+# ETH_RPC_URL / MAINNET_RPC / MAINNET_HTTP_URL / ALCHEMY_MAINNET_RPC
+w3 = make_web3("mainnet")
 if not w3.is_connected():
     raise RuntimeError("无法连接以太坊主网，请检查 RPC 地址是否正确、网络是否可达")
 
@@ -61,180 +60,164 @@ def get_latest_block() -> int:
 
 
 # -------------------------------------------------------------------
-# 使用 RPC 扫描 Transfer 日志（自适应缩小区间）
+# 地址聚合 + topN 选择
 # -------------------------------------------------------------------
-def fetch_transfer_logs_via_rpc(
-    token: str,
-    start_block: int,
-    end_block: int,
-    initial_step: int = 5000,
-    min_step: int = 128,
-) -> List[Dict[str, Any]]:
-    """
-    用 eth_getLogs 按区间扫描 ERC20 Transfer 日志。
-    如果某个区间日志数 >10000 导致 -32005，则自动缩小 step 重试。
-    """
-    token = Web3.to_checksum_address(token)
-    logs: List[Dict[str, Any]] = []
-
-    print(
-        f"📡 通过 RPC 扫描 Transfer 日志: token={token}, "
-        f"blocks=[{start_block}, {end_block}], step={initial_step}"
-    )
-
-    step = initial_step
-    current = start_block
-
-    while current <= end_block:
-        to_block = min(current + step - 1, end_block)
-
-        # 内层循环：如果这一段触发 10000 条限制，就缩小步长重试
-        while True:
-            print(f"  · 扫描区块区间 [{current}, {to_block}] ... ", end="", flush=True)
-            try:
-                part = w3.eth.get_logs(
-                    {
-                        "fromBlock": current,
-                        "toBlock": to_block,
-                        "address": token,
-                        "topics": [TRANSFER_TOPIC0],
-                    }
-                )
-                print(f"ok, 本段日志数={len(part)}")
-                logs.extend(part)
-                break  # 成功则跳出内层 while，向前推进区间
-            except ValueError as e:
-                # web3 把 RPC 错误塞在 e.args[0] 里（通常是 dict）
-                err_obj = e.args[0] if e.args else {}
-                code = None
-                msg = str(e)
-                if isinstance(err_obj, dict):
-                    code = err_obj.get("code")
-                    msg = err_obj.get("message", msg)
-
-                print(f"⚠️ get_logs 失败: {err_obj}")
-
-                # 典型：{'code': -32005, 'message': 'query returned more than 10000 results. ...'}
-                if code == -32005 or "more than 10000 results" in msg:
-                    if step <= min_step:
-                        print("  ❌ 步长已缩小到下限仍超过 10000 条，跳过这一小段。")
-                        break
-                    # 把步长减半，重新计算 to_block 再试
-                    step = max(step // 2, min_step)
-                    to_block = min(current + step - 1, end_block)
-                    print(f"  ↪️ 将步长缩小为 {step} 重新尝试该区间。")
-                    continue
-                else:
-                    # 其他错误（比如 RPC 暂时出问题），这段直接跳过，后面继续
-                    print("  ❌ 非 10000 条限制类错误，跳过这一小段。")
-                    break
-
-        # 推进到下一个区间
-        current = to_block + 1
-
-    print(f"✅ 共收集 Transfer 日志 {len(logs)} 条")
-    return logs
+ZERO_ADDRESS = bytes(20)
 
 
-# -------------------------------------------------------------------
-# 把日志转换为类似 Etherscan tokentx 的结构，便于复用聚合逻辑
-# -------------------------------------------------------------------
-def logs_to_tx_like(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    txs: List[Dict[str, Any]] = []
-    for log in logs:
-        topics = log.get("topics") or []
-        data = log.get("data") or "0x"
+def _hex_address(addr: bytes) -> str:
+    return "0x" + addr.hex()
 
-        if len(topics) < 3:
-            continue
 
-        try:
-            # topics[1], topics[2] 为 from / to（indexed address）
-            from_addr = "0x" + topics[1].hex()[-40:]
-            to_addr = "0x" + topics[2].hex()[-40:]
+class WhaleAccumulator:
+    """
+    流式聚合：每扫完一个区间就把该段日志批量解码（decode_transfer_logs）后
+    直接累加进按地址的 [volume, tx_count]，日志本身随即丢弃，内存只和地址数有关。
+    地址一律用 intern 过的 20 字节 bytes 作 key，只在输出时才转成 hex 字符串。
+    口径：每条转账的 from / to 都计入 volume 和 tx_count，value <= 0 与零地址跳过。
+    """
 
-            # data 为 32 bytes 的 uint256 数量
-            if isinstance(data, bytes):
-                value = int.from_bytes(data, "big")
-            else:
-                # 字符串形式 '0x...'
-                value = int(data, 16)
-        except Exception:
-            continue
+    __slots__ = ("totals", "log_count", "_intern")
 
-        txs.append(
-            {
-                "from": from_addr,
-                "to": to_addr,
-                "value": str(value),
-            }
-        )
-    return txs
+    def __init__(self):
+        # addr(20 bytes) -> [volume, tx_count]
+        self.totals: Dict[bytes, List[int]] = {}
+        self.log_count = 0
+        # 地址 intern 表，零地址预先放进去，之后可以直接用 is 比较
+        self._intern: Dict[bytes, bytes] = {ZERO_ADDRESS: ZERO_ADDRESS}
 
+    def add_logs(self, logs: List[Dict[str, Any]]):
+        cols = decode_transfer_logs(logs, self._intern)
+        self.log_count += len(cols["value"])
 
-# -------------------------------------------------------------------
-# 地址聚合 + topN 选择
-# -------------------------------------------------------------------
-def aggregate_whales(
-    txs: List[Dict[str, Any]],
-    min_volume_wei: int | None = None,
-) -> Dict[str, Dict[str, Any]]:
+        totals = self.totals
+        zero = self._intern[ZERO_ADDRESS]
+        for from_addr, to_addr, value in zip(cols["from"], cols["to"], cols["value"]):
+            if value <= 0:
+                continue
+            for addr in (from_addr, to_addr):
+                if addr is zero:
+                    continue
+                acc = totals.get(addr)
+                if acc is None:
+                    totals[addr] = [value, 1]
+                else:
+                    acc[0] += value
+                    acc[1] += 1
+
+    def to_binary_totals(self) -> Dict[bytes, List[int]]:
+        """检查点存储同样用 20 字节地址作 key，直接交出去。"""
+        return self.totals
+
+    @classmethod
+    def from_binary_totals(cls, totals: Dict[bytes, List[int]], log_count: int = 0) -> "WhaleAccumulator":
+        acc = cls()
+        acc.totals = totals
+        acc.log_count = log_count
+        return acc
+
+    def top(self, top_n: int = 10, min_volume_wei: int | None = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """有界堆选前 top_n 名，不对全部地址排序。"""
+        items = self.totals.items()
+        if min_volume_wei is not None:
+            items = ((a, vn) for a, vn in items if vn[0] >= min_volume_wei)
+        best = heapq.nlargest(top_n, items, key=lambda kv: kv[1][0])
+        return [(_hex_address(a), {"volume": v, "tx_count": n}) for a, (v, n) in best]
+
+
+def merge_adjacent_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """把首尾相接的区间合并，交给扫描器时步长不会被检查点的分段边界截断。"""
+    merged: List[Tuple[int, int]] = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def refresh_whale_stats(
+    store: WhaleScanStore,
+    token: str,
+    start_block: int,
+    end_block: int,
+    initial_step: int = 5000,
+    min_step: int = 1,
+    workers: int = SCAN_WORKERS,
+) -> WhaleAccumulator:
     """
-    把一批 token 转账交易按地址聚合，按「绝对成交额总和」统计。
-
-    - 每条 tx 的 from / to 都视为候选地址
-    - volume = 该地址发送 + 接收的总和（单位 Wei）
+    滚动窗口 [start_block, end_block] 的鲸鱼统计，带断点续扫：
+      1) 删掉窗口起点之前的旧区间
+      2) 所有缺口交给一次 scan_log_ranges（密度估计跨段延续），
+         某一段的子区间全部扫完就立刻落盘该段的检查点
+      3) 从检查点汇总整个窗口
     """
-    stats: Dict[str, Dict[str, Any]] = {}
+    token = Web3.to_checksum_address(token)
 
-    for tx in txs:
-        value_str = tx.get("value") or "0"
-        try:
-            value = int(value_str)
-        except Exception:
-            continue
+    pruned = store.prune(token, start_block)
+    if pruned:
+        print(f"🧹 已移出滚动窗口的旧区间 {pruned} 个")
 
-        if value <= 0:
-            continue
+    pieces = plan_missing_ranges(store.covered_ranges(token), start_block, end_block)
+    print(f"🧭 需要补扫的区间 {len(pieces)} 段（已扫过的区块直接复用检查点）")
 
-        from_addr = (tx.get("from") or "").lower()
-        to_addr = (tx.get("to") or "").lower()
+    piece_starts = [lo for lo, _ in pieces]
+    # 段起点 -> [还没扫完的区块数, 该段的聚合结果]
+    progress: Dict[int, List[Any]] = {lo: [hi - lo + 1, WhaleAccumulator()] for lo, hi in pieces}
 
-        for addr in (from_addr, to_addr):
-            if not addr or addr == "0x0000000000000000000000000000000000000000":
+    def on_range(lo: int, hi: int, part: List[Any]):
+        i = bisect.bisect_right(piece_starts, lo) - 1
+        while i < len(pieces) and pieces[i][0] <= hi:
+            seg_lo, seg_hi = pieces[i]
+            i += 1
+            a, b = max(lo, seg_lo), min(hi, seg_hi)
+            if a > b:
                 continue
-            s = stats.setdefault(addr, {"volume": 0, "tx_count": 0})
-            s["volume"] += value
-            s["tx_count"] += 1
+            entry = progress[seg_lo]
+            if a == lo and b == hi:
+                entry[1].add_logs(part)
+            else:
+                entry[1].add_logs([log for log in part if a <= log["blockNumber"] <= b])
+            entry[0] -= b - a + 1
+            if entry[0] == 0:
+                acc = entry[1]
+                store.save_chunk(token, seg_lo, seg_hi, acc.to_binary_totals(), acc.log_count)
+                del progress[seg_lo]
+                print(f"💾 已保存区间 [{seg_lo}, {seg_hi}] 检查点")
+
+    if pieces:
+        print(
+            f"📡 流式扫描 Transfer 日志: token={token}, "
+            f"缺口={len(merge_adjacent_ranges(pieces))} 段, workers={workers}"
+        )
+        failed = scan_log_ranges(
+            w3,
+            {"address": token, "topics": [TRANSFER_TOPIC0]},
+            merge_adjacent_ranges(pieces),
+            on_range=on_range,
+            workers=workers,
+            initial_step=initial_step,
+            min_step=min_step,
+        )
+        if failed:
+            print(f"⚠️ 有 {len(failed)} 个区间最终扫描失败: {failed}")
 
-    if min_volume_wei is not None:
-        stats = {
-            a: v for a, v in stats.items()
-            if v["volume"] >= min_volume_wei
-        }
+    if progress:
+        # 有子区间失败的段不写检查点，下次运行会重扫
+        print(f"⚠️ 有 {len(progress)} 段没有扫完，本次排名缺少这些区块，重新运行会自动补扫")
 
-    print(f"📈 完成地址聚合，候选地址数: {len(stats)}")
-    return stats
+    totals, log_count = store.load_window(token, start_block, end_block)
+    acc = WhaleAccumulator.from_binary_totals(totals, log_count)
+    print(f"📈 窗口汇总：日志 {acc.log_count} 条，候选地址数 {len(acc.totals)}")
+    return acc
 
 
-def pick_top_whales(
-    stats: Dict[str, Dict[str, Any]],
-    top_n: int = 10,
-) -> List[Tuple[str, Dict[str, Any]]]:
-    """
-    按 volume 排序，取前 top_n 名。
-    """
-    whales = sorted(
-        stats.items(),
-        key=lambda kv: kv[1]["volume"],
-        reverse=True,
-    )[:top_n]
+def print_top_whales(whales: List[Tuple[str, Dict[str, Any]]]):
     print("🏆 选出前 {} 名鲸鱼地址:".format(len(whales)))
     for i, (addr, v) in enumerate(whales, start=1):
         print(
             f"  #{i} {addr} | volume={v['volume']} Wei | tx_count={v['tx_count']}"
         )
-    return whales
 
 
 # -------------------------------------------------------------------
@@ -271,7 +254,8 @@ def _dump_markets_file(
     else:
         raw = markets
 
-    path.write_text(json.dumps(raw, indent=2), encoding="utf-8")
+    # 原子替换：正在运行的 monitor 读到的要么是旧文件，要么是完整的新文件
+    atomic_write_json(path, raw)
     print(f"💾 已更新 {path}，当前 markets 总条数: {len(markets)}")
 
 
@@ -284,7 +268,17 @@ def update_markets_with_whales(
     在 markets.json 里：
       1) 删除旧的自动鲸鱼条目（label 以 AUTO_WHALE_ 开头或 meta.source == "collect_eth_whales"）
       2) 追加新的鲸鱼条目
+    整个读-改-写过程持有 markets.json.lock 排他锁，并发写入不会互相覆盖。
     """
+    with markets_file_lock(MARKETS_PATH):
+        _update_markets_locked(whales, token_address, network)
+
+
+def _update_markets_locked(
+    whales: List[Tuple[str, Dict[str, Any]]],
+    token_address: str,
+    network: str,
+):
     markets, wrapped = _load_markets_file(MARKETS_PATH)
 
     # 1) 过滤掉旧的自动鲸鱼
@@ -359,6 +353,17 @@ def main():
         default=0.0,
         help="过滤最小累计成交额（ETH），默认不过滤，比如 50 表示只保留成交总额 ≥50 ETH 的地址",
     )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=str(WHALE_SCAN_DB_PATH),
+        help="断点续扫检查点的 SQLite 文件（默认 backend/whale_scan.db）",
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="忽略已有检查点，从头扫描整个窗口",
+    )
 
     args = parser.parse_args()
 
@@ -366,22 +371,22 @@ def main():
     latest = get_latest_block()
     start = max(0, latest - args.blocks)
 
-    # 1. 扫描 Transfer 日志
-    raw_logs = fetch_transfer_logs_via_rpc(
-        token=token,
-        start_block=start,
-        end_block=latest,
-    )
-
-    # 2. 转成类似 tokentx 的结构，再做地址聚合
-    tx_like = logs_to_tx_like(raw_logs)
-
     min_volume_wei = None
     if args.min_volume_eth and args.min_volume_eth > 0:
         min_volume_wei = int(args.min_volume_eth * 10**18)
 
-    stats = aggregate_whales(tx_like, min_volume_wei=min_volume_wei)
-    whales = pick_top_whales(stats, top_n=args.top)
+    # 1. 扫描 Transfer 日志，逐段累加进地址统计并保存检查点（只补扫新区块）
+    store = WhaleScanStore(args.store)
+    try:
+        if args.fresh:
+            store.clear(token)
+        acc = refresh_whale_stats(store, token, start_block=start, end_block=latest)
+    finally:
+        store.close()
+
+    # 2. 有界堆选前 N 名
+    whales = acc.top(args.top, min_volume_wei=min_volume_wei)
+    print_top_whales(whales)
 
     # 3. 直接写回 markets.json
     update_markets_with_whales(whales, token_address=token, network="mainnet")
@@ -1,35 +1,137 @@
 import os
+import threading
+import time
 from dotenv import load_dotenv
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
 import json
 from pathlib import Path
+from typing import Any, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
 
 load_dotenv()
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 
-def make_web3(network: str = "mainnet") -> Web3:
-    if network == "mainnet":
-        rpc = os.getenv("ETH_RPC_URL")
-    elif network == "sepolia":
-        rpc = os.getenv("SEPOLIA_RPC_URL")
-    else:
+# 各网络 RPC 依次尝试的环境变量
+RPC_ENV_VARS = {
+    "mainnet": ("ETH_RPC_URL", "MAINNET_RPC", "MAINNET_HTTP_URL", "ALCHEMY_MAINNET_RPC"),
+    "sepolia": ("SEPOLIA_RPC_URL",),
+}
+
+# keep-alive 连接池大小（并发抓取时每个网络最多同时占用的 HTTP 连接数）
+WEB3_POOL_SIZE = int(os.getenv("WEB3_POOL_SIZE", "16"))
+# 距上次健康检查超过这么多秒，下次取用时才重新探活
+WEB3_HEALTH_CHECK_INTERVAL = int(os.getenv("WEB3_HEALTH_CHECK_INTERVAL", "300"))
+
+# network -> {"w3", "session", "rpc", "checked_at"}
+_web3_clients: Dict[str, Dict[str, Any]] = {}
+# 全局锁只保护 _web3_locks 本身；建连 / 探活用每个网络自己的锁，慢节点不会拖住别的网络
+_web3_lock = threading.Lock()
+_web3_locks: Dict[str, threading.Lock] = {}
+
+
+def _resolve_rpc(network: str) -> str:
+    env_vars = RPC_ENV_VARS.get(network)
+    if env_vars is None:
         raise ValueError(f"未知网络: {network}")
 
-    if not rpc:
-        raise RuntimeError(f"{network} 的 RPC 未在 .env 中配置")
+    for name in env_vars:
+        rpc = os.getenv(name)
+        if rpc:
+            return rpc
+    raise RuntimeError(f"{network} 的 RPC 未在 .env 中配置")
+
+
+class SharedSessionHTTPProvider(Web3.HTTPProvider):
+    """
+    web3 6.x 的 HTTPProvider(session=...) 只把 session 登记给构造它的那个线程
+    （web3/_utils/request.py 按 threading.get_ident() 缓存 session），
+    其它线程调用 w3.eth.* 时会各自新建一个默认大小的 requests.Session。
+    这里所有线程都直接走同一个 session，连接池在线程之间真正共享。
+    """
+
+    def __init__(self, endpoint_uri: str, session: requests.Session, request_kwargs: Any = None):
+        super().__init__(endpoint_uri, request_kwargs=request_kwargs)
+        self.session = session
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        response = self.session.post(self.endpoint_uri, data=request_data, **self.get_request_kwargs())
+        response.raise_for_status()
+        return self.decode_rpc_response(response.content)
+
+
+def _build_client(network: str) -> Dict[str, Any]:
+    rpc = _resolve_rpc(network)
 
-    w3 = Web3(Web3.HTTPProvider(rpc))
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=WEB3_POOL_SIZE, pool_maxsize=WEB3_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    w3 = Web3(SharedSessionHTTPProvider(rpc, session, request_kwargs={"timeout": 30}))
 
     if network == "sepolia":
         w3.middleware_onion.inject(geth_poa_middleware, layer=0)
 
-    if not w3.is_connected():
-        raise RuntimeError(f"无法连接 {network} 节点: {rpc}")
+    print(f"✅ 已创建 {network} 连接池 (pool_size={WEB3_POOL_SIZE})")
+    # 新建时不探活，第一次真实调用失败自然会报错
+    return {"w3": w3, "session": session, "rpc": rpc, "checked_at": time.time()}
+
+
+def _network_lock(network: str) -> threading.Lock:
+    with _web3_lock:
+        lock = _web3_locks.get(network)
+        if lock is None:
+            lock = _web3_locks[network] = threading.Lock()
+        return lock
+
+
+def make_web3(network: str = "mainnet") -> Web3:
+    """
+    返回按网络缓存的共享 Web3 客户端（底层是 keep-alive 的 requests.Session 连接池）。
+    只有距上次检查超过 WEB3_HEALTH_CHECK_INTERVAL 秒时才探活，失败则重建一次。
+    探活 / 重建只持有该网络自己的锁；同一网络已有客户端、别的线程正在探活时直接返回现有客户端。
+    """
+    client = _web3_clients.get(network)
+    if client is not None and time.time() - client["checked_at"] < WEB3_HEALTH_CHECK_INTERVAL:
+        return client["w3"]
+
+    lock = _network_lock(network)
+    if client is not None:
+        if not lock.acquire(blocking=False):
+            return client["w3"]
+    else:
+        lock.acquire()
+
+    try:
+        client = _web3_clients.get(network)
+        if client is None:
+            client = _web3_clients[network] = _build_client(network)
+
+        if time.time() - client["checked_at"] < WEB3_HEALTH_CHECK_INTERVAL:
+            return client["w3"]
+
+        if not client["w3"].is_connected():
+            client["session"].close()
+            client = _web3_clients[network] = _build_client(network)
+            if not client["w3"].is_connected():
+                del _web3_clients[network]
+                raise RuntimeError(f"无法连接 {network} 节点: {client['rpc']}")
+
+        client["checked_at"] = time.time()
+        return client["w3"]
+    finally:
+        lock.release()
+
 
-    print(f"✅ 已连接 {network}, 最新区块: {w3.eth.block_number}")
-    return w3
+def get_rpc_session(network: str = "mainnet") -> requests.Session:
+    """和 make_web3 共用同一个连接池，给需要直接发 JSON-RPC 的地方（如 batch 请求）用。"""
+    make_web3(network)
+    return _web3_clients[network]["session"]
 
 
 def load_risk_monitor_contract(network: str = "sepolia"):
@@ -1,18 +1,173 @@
 # backend/db.py
 
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+
+from trades import TradeBatch, TradesLike, as_trade_batch
 
 # 统一使用这个数据库文件
 DB_PATH = Path(__file__).resolve().parent / "defi_monitor.db"
 
+# PRAGMA user_version 记录的 schema 版本
+#   0: 初始版本，大整数只有 TEXT
+#   1: 大整数额外存定宽 BLOB（精确、可排序）+ REAL（可 SUM / AVG）
+#   2: risk_metrics / risk_levels 的 (market_id, id) / (market_id, created_at) 等二级索引
+#   3: risk_rollups 降采样表（1m / 15m / 1h / 1d），回填历史数据
+#   4: trades 去重键从 tx_hash 改为 (pair_address, tx_hash, log_index)
+SCHEMA_VERSION = 4
+
+# 连接级性能参数：WAL 让 API 读和监控写互不阻塞；
+# WAL 下 synchronous=NORMAL 只在 checkpoint 时 fsync，掉电最多丢最后几个事务，不会损坏库
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -64_000),         # 负数表示 KiB，约 64MB
+    ("mmap_size", 256 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),          # 毫秒，写锁被占用时等待而不是立刻报错
+)
+
+# ------------------------------------------------------------------
+# 大整数数值编码
+#   *_be  : 33 字节大端 BLOB，存 value + 2^263，负数也能按字节序正确排序，精确可逆
+#   *_num : REAL 近似值，给 SQL 做 SUM / AVG / 范围过滤
+# ------------------------------------------------------------------
+INT_BLOB_WIDTH = 33
+_INT_BLOB_BIAS = 1 << (INT_BLOB_WIDTH * 8 - 1)
+
+# 需要数值编码的大整数列
+NUMERIC_COLUMNS = {
+    "trades": ("amount_in", "amount_out"),
+    "risk_metrics": ("dex_volume", "whale_sell_total", "cex_net_inflow", "pool_liquidity"),
+}
+
+
+# ------------------------------------------------------------------
+# 降采样 rollup：每个 (market_id, resolution, bucket_start) 一行，写入时增量 UPSERT
+#   等级：样本数 / 最大值 / 最后一个值
+#   指标：样本数 / 各因子 *_num 之和（读时除以样本数得均值）/ 最大值
+# ------------------------------------------------------------------
+ROLLUP_RESOLUTIONS = (60, 15 * 60, 60 * 60, 24 * 60 * 60)
+
+# 参与 rollup 的指标列 -> risk_metrics 里的数值列
+ROLLUP_METRICS = {
+    "dex_volume": "dex_volume_num",
+    "dex_trades": "dex_trades",
+    "whale_sell_total": "whale_sell_total_num",
+    "whale_count_selling": "whale_count_selling",
+    "cex_net_inflow": "cex_net_inflow_num",
+    "pool_liquidity": "pool_liquidity_num",
+}
+
+_ROLLUP_RES_SQL = " UNION ALL ".join(f"SELECT {r} AS res" for r in ROLLUP_RESOLUTIONS)
+_ROLLUP_BUCKET_SQL = "(CAST(strftime('%s', src.created_at) AS INTEGER) / r.res) * r.res"
+
+_ROLLUP_METRIC_COLS = ", ".join(f"{m}_sum, {m}_max" for m in ROLLUP_METRICS)
+_ROLLUP_METRIC_ROW = ", ".join(f"src.{c}, src.{c}" for c in ROLLUP_METRICS.values())
+_ROLLUP_METRIC_AGG = ", ".join(f"SUM(src.{c}), MAX(src.{c})" for c in ROLLUP_METRICS.values())
+_ROLLUP_METRIC_UPDATE = ",\n    ".join(
+    f"{m}_sum = COALESCE({m}_sum, 0) + excluded.{m}_sum, "
+    f"{m}_max = MAX(COALESCE({m}_max, excluded.{m}_max), excluded.{m}_max)"
+    for m in ROLLUP_METRICS
+)
+
+_ROLLUP_LEVEL_UPSERT = """
+ON CONFLICT(market_id, resolution, bucket_start) DO UPDATE SET
+    level_samples = level_samples + excluded.level_samples,
+    level_max = MAX(COALESCE(level_max, excluded.level_max), excluded.level_max),
+    level_last = CASE
+        WHEN excluded.level_last_id >= COALESCE(level_last_id, 0) THEN excluded.level_last
+        ELSE level_last
+    END,
+    level_last_id = MAX(COALESCE(level_last_id, 0), excluded.level_last_id)
+"""
+_ROLLUP_METRIC_UPSERT = f"""
+ON CONFLICT(market_id, resolution, bucket_start) DO UPDATE SET
+    metric_samples = metric_samples + excluded.metric_samples,
+    {_ROLLUP_METRIC_UPDATE}
+"""
+
+# 单行写入后把刚插入的那一行累加进所有分辨率的桶（时间取该行自己的 created_at）
+SQL_ROLLUP_LEVEL_ROW = f"""
+INSERT INTO risk_rollups (
+    market_id, resolution, bucket_start, level_samples, level_max, level_last, level_last_id
+)
+SELECT src.market_id, r.res, {_ROLLUP_BUCKET_SQL}, 1, src.level, src.level, src.id
+FROM risk_levels AS src, ({_ROLLUP_RES_SQL}) AS r
+WHERE src.id = ?
+{_ROLLUP_LEVEL_UPSERT}
+"""
+SQL_ROLLUP_METRICS_ROW = f"""
+INSERT INTO risk_rollups (market_id, resolution, bucket_start, metric_samples, {_ROLLUP_METRIC_COLS})
+SELECT src.market_id, r.res, {_ROLLUP_BUCKET_SQL}, 1, {_ROLLUP_METRIC_ROW}
+FROM risk_metrics AS src, ({_ROLLUP_RES_SQL}) AS r
+WHERE src.id = ?
+{_ROLLUP_METRIC_UPSERT}
+"""
+
+# 回填：按 id 区间分组聚合，同样 UPSERT 进桶里（level_last 之后按 level_last_id 补）
+SQL_ROLLUP_LEVEL_RANGE = f"""
+INSERT INTO risk_rollups (
+    market_id, resolution, bucket_start, level_samples, level_max, level_last_id
+)
+SELECT src.market_id, r.res, {_ROLLUP_BUCKET_SQL} AS bucket, COUNT(*), MAX(src.level), MAX(src.id)
+FROM risk_levels AS src, ({_ROLLUP_RES_SQL}) AS r
+WHERE src.id > ? AND src.id <= ?
+GROUP BY src.market_id, r.res, bucket
+{_ROLLUP_LEVEL_UPSERT}
+"""
+SQL_ROLLUP_METRICS_RANGE = f"""
+INSERT INTO risk_rollups (market_id, resolution, bucket_start, metric_samples, {_ROLLUP_METRIC_COLS})
+SELECT src.market_id, r.res, {_ROLLUP_BUCKET_SQL} AS bucket, COUNT(*), {_ROLLUP_METRIC_AGG}
+FROM risk_metrics AS src, ({_ROLLUP_RES_SQL}) AS r
+WHERE src.id > ? AND src.id <= ?
+GROUP BY src.market_id, r.res, bucket
+{_ROLLUP_METRIC_UPSERT}
+"""
+
+
+def pick_rollup_resolution(span_seconds: float, max_points: int = 500) -> int:
+    """桶数不超过 max_points 的最细分辨率；跨度再大也最多退到 1d。"""
+    for res in ROLLUP_RESOLUTIONS:
+        if span_seconds / res <= max_points:
+            return res
+    return ROLLUP_RESOLUTIONS[-1]
+
+
+def encode_int(value: int) -> bytes:
+    return (int(value) + _INT_BLOB_BIAS).to_bytes(INT_BLOB_WIDTH, "big")
+
+
+def decode_int(blob: Optional[bytes]) -> int:
+    if blob is None:
+        return 0
+    return int.from_bytes(blob, "big") - _INT_BLOB_BIAS
+
+
+def numeric_pair(value: int) -> Tuple[bytes, float]:
+    """返回 (*_be, *_num) 两列要写入的值。"""
+    v = int(value)
+    return encode_int(v), float(v)
+
+
+def apply_pragmas(conn: sqlite3.Connection):
+    for name, value in SQLITE_PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+
 
 class MonitorDatabase:
     def __init__(self, db_path: Path | str = DB_PATH):
         self.db_path = str(db_path)
         # 加上 check_same_thread=False，方便 Flask / 监控脚本复用同一个类
         self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        apply_pragmas(self.conn)
+        # unit_of_work 嵌套深度；>0 时各 save_* 只写不提交，由外层统一 commit
+        self._uow_depth = 0
+        self._uow_lock = threading.RLock()
         self.create_tables()
 
     # ------------------------------------------------------------------
@@ -26,15 +181,21 @@ class MonitorDatabase:
             """
             CREATE TABLE IF NOT EXISTS trades (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                pair_address TEXT,  -- 所属 DEX 池子（小写）
                 timestamp INTEGER,
                 block_number INTEGER,
-                tx_hash TEXT UNIQUE,
+                tx_hash TEXT,
+                log_index INTEGER NOT NULL DEFAULT 0,  -- 同一 tx 内的多个 Swap 用它区分
                 token_in TEXT,
                 token_out TEXT,
                 amount_in TEXT,     -- 大整数，统一按字符串存
                 amount_out TEXT,    -- 同上
                 gas_used TEXT,      -- 同上
                 gas_price TEXT,     -- 同上
+                amount_in_be BLOB,  -- 数值编码，见 encode_int
+                amount_in_num REAL,
+                amount_out_be BLOB,
+                amount_out_num REAL,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
             """
@@ -65,65 +226,487 @@ class MonitorDatabase:
                 whale_count_selling INTEGER,
                 cex_net_inflow TEXT,
                 pool_liquidity TEXT,
+                dex_volume_be BLOB,        -- 数值编码，见 encode_int
+                dex_volume_num REAL,
+                whale_sell_total_be BLOB,
+                whale_sell_total_num REAL,
+                cex_net_inflow_be BLOB,
+                cex_net_inflow_num REAL,
+                pool_liquidity_be BLOB,
+                pool_liquidity_num REAL,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
             """
         )
 
+        # 4) 每个池子的增量抓取游标：已入库的最后一个区块
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ingest_cursors (
+                pair_address TEXT PRIMARY KEY,
+                last_block INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+
+        # 5) 池子 reserves 时间序列：每个区块最后一个 Sync 事件的值
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pool_reserves (
+                pair_address TEXT NOT NULL,
+                block_number INTEGER NOT NULL,
+                reserve0 TEXT NOT NULL,   -- 大整数按字符串存
+                reserve1 TEXT NOT NULL,
+                PRIMARY KEY (pair_address, block_number)
+            )
+            """
+        )
+
+        # 6) 风险等级 / 指标的降采样桶（长时间跨度画图用），见 ROLLUP_RESOLUTIONS
+        metric_decls = "".join(
+            f"""
+                {m}_sum REAL,
+                {m}_max REAL,"""
+            for m in ROLLUP_METRICS
+        )
+        c.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS risk_rollups (
+                market_id TEXT NOT NULL,
+                resolution INTEGER NOT NULL,     -- 桶宽（秒）
+                bucket_start INTEGER NOT NULL,   -- 桶起点（UTC Unix 秒）
+                level_samples INTEGER NOT NULL DEFAULT 0,
+                level_max INTEGER,
+                level_last INTEGER,
+                level_last_id INTEGER,           -- level_last 对应的 risk_levels.id
+                metric_samples INTEGER NOT NULL DEFAULT 0,{metric_decls}
+                PRIMARY KEY (market_id, resolution, bucket_start)
+            ) WITHOUT ROWID
+            """
+        )
+
+        # 老库的 trades 没有 pair_address 列，补上
+        self._ensure_column("trades", "pair_address", "TEXT")
+        c.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_trades_pair_block
+            ON trades(pair_address, block_number)
+            """
+        )
+
         self.conn.commit()
+        self.migrate()
 
     # ------------------------------------------------------------------
-    # 交易明细
+    # schema 迁移：按 PRAGMA user_version 逐级升级，可以在线重复执行
     # ------------------------------------------------------------------
-    def save_trades(self, trades: List[Dict[str, Any]]):
-        if not trades:
-            return
+    def migrate(self):
+        steps = (
+            (1, self._migrate_numeric_columns),
+            (2, self._migrate_indexes),
+            (3, self._migrate_rollups),
+            (4, self._migrate_trades_log_key),
+        )
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, step in steps:
+            if version < target:
+                step()
+                self.conn.execute(f"PRAGMA user_version = {target}")
+                self.conn.commit()
+                version = target
+
+    def _migrate_numeric_columns(self, chunk_size: int = 5000):
+        """
+        v0 -> v1：给大整数列补 *_be / *_num，再分批回填。
+        每批单独提交，不会长时间锁库；中途中断后重启会从还没回填的行继续。
+        """
+        for table, columns in NUMERIC_COLUMNS.items():
+            for col in columns:
+                self._ensure_column(table, f"{col}_be", "BLOB")
+                self._ensure_column(table, f"{col}_num", "REAL")
+            self.conn.commit()
 
+            select_cols = ", ".join(columns)
+            set_clause = ", ".join(f"{col}_be = ?, {col}_num = ?" for col in columns)
+            migrated = 0
+            while True:
+                rows = self.conn.execute(
+                    f"""
+                    SELECT id, {select_cols}
+                    FROM {table}
+                    WHERE {columns[0]}_be IS NULL
+                    LIMIT ?
+                    """,
+                    (chunk_size,),
+                ).fetchall()
+                if not rows:
+                    break
+
+                updates = []
+                for row_id, *raw_values in rows:
+                    params: List[Any] = []
+                    for raw in raw_values:
+                        try:
+                            v = int(raw)
+                        except Exception:
+                            v = 0
+                        params.extend(numeric_pair(v))
+                    params.append(row_id)
+                    updates.append(params)
+
+                with self.conn:
+                    self.conn.executemany(f"UPDATE {table} SET {set_clause} WHERE id = ?", updates)
+                migrated += len(rows)
+
+            if migrated:
+                print(f"🔧 {table} 已回填数值列 {migrated} 行")
+
+    def _migrate_indexes(self):
+        """
+        v1 -> v2：给按市场倒序取最近 N 条、按时间排序的查询加索引。
+          - load_recent_metrics: WHERE market_id = ? ORDER BY id DESC
+          - /api/risk:           [WHERE market_id = ?] ORDER BY id DESC
+          - evaluate_signal:     WHERE market_id = ? ORDER BY created_at
+        """
         with self.conn:
-            c = self.conn.cursor()
-            c.executemany(
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_risk_metrics_market_id ON risk_metrics(market_id, id)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_risk_levels_market_id ON risk_levels(market_id, id)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_risk_levels_market_created ON risk_levels(market_id, created_at)"
+            )
+        self.conn.execute("ANALYZE")
+
+    def _migrate_rollups(self, chunk_size: int = 20000):
+        """
+        v2 -> v3：从历史 risk_levels / risk_metrics 回填 risk_rollups。
+        先清空再按 id 区间分批聚合（每批一个事务），之后由 save_* 增量维护。
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM risk_rollups")
+
+        for table, sql in (
+            ("risk_levels", SQL_ROLLUP_LEVEL_RANGE),
+            ("risk_metrics", SQL_ROLLUP_METRICS_RANGE),
+        ):
+            max_id = self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+            for lo in range(0, max_id, chunk_size):
+                with self.conn:
+                    self.conn.execute(sql, (lo, lo + chunk_size))
+            if max_id:
+                print(f"🔧 {table} 已回填 rollup（共 {max_id} 行）")
+
+        with self.conn:
+            self.conn.execute(
+                """
+                UPDATE risk_rollups
+                SET level_last = (SELECT level FROM risk_levels WHERE id = risk_rollups.level_last_id)
+                WHERE level_last_id IS NOT NULL
+                """
+            )
+
+    def _migrate_trades_log_key(self):
+        """
+        v3 -> v4：trades 原来是 tx_hash UNIQUE，一笔 tx 里的多个 Swap（多跳路由 / 聚合器）
+        只剩一条，同一 tx 碰到两个池子时还会把行“搬”到另一个池子。
+        改成按 (pair_address, tx_hash, log_index) 唯一。UNIQUE 约束改不了，只能重建表；
+        老数据没有 log_index，按 0 迁移（旧键下它们本来就各自唯一）。
+        """
+        cols = [row[1] for row in self.conn.execute("PRAGMA table_info(trades)")]
+        has_tx_unique = any(
+            idx[2] and [c[2] for c in self.conn.execute(f"PRAGMA index_info('{idx[1]}')")] == ["tx_hash"]
+            for idx in self.conn.execute("PRAGMA index_list(trades)")
+        )
+
+        with self.conn:
+            if has_tx_unique or "log_index" not in cols:
+                copy_cols = [c for c in cols if c != "log_index"]
+                col_list = ", ".join(copy_cols)
+                self.conn.execute("ALTER TABLE trades RENAME TO trades_v3")
+                self.conn.execute(
+                    """
+                    CREATE TABLE trades (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        pair_address TEXT,
+                        timestamp INTEGER,
+                        block_number INTEGER,
+                        tx_hash TEXT,
+                        log_index INTEGER NOT NULL DEFAULT 0,
+                        token_in TEXT,
+                        token_out TEXT,
+                        amount_in TEXT,
+                        amount_out TEXT,
+                        gas_used TEXT,
+                        gas_price TEXT,
+                        amount_in_be BLOB,
+                        amount_in_num REAL,
+                        amount_out_be BLOB,
+                        amount_out_num REAL,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                    """
+                )
+                self.conn.execute(f"INSERT INTO trades ({col_list}) SELECT {col_list} FROM trades_v3")
+                self.conn.execute("DROP TABLE trades_v3")
+                self.conn.execute("UPDATE trades SET pair_address = '' WHERE pair_address IS NULL")
+                self.conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_trades_pair_block ON trades(pair_address, block_number)"
+                )
+                print("🔧 trades 已重建为按 (pair_address, tx_hash, log_index) 去重")
+
+            self.conn.execute(
+                """
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_trades_pair_tx_log
+                ON trades(pair_address, tx_hash, log_index)
                 """
-                INSERT OR IGNORE INTO trades(
+            )
+
+    def _ensure_column(self, table: str, column: str, decl: str):
+        cols = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        if column not in cols:
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    # ------------------------------------------------------------------
+    # 事务：单次写入 / 整轮 unit of work
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _write(self):
+        """单个 save_* 的写入范围：不在 unit_of_work 里就自己提交，否则交给外层。"""
+        if self._uow_depth:
+            yield
+            return
+        with self.conn:
+            yield
+
+    @contextmanager
+    def unit_of_work(self):
+        """
+        把一整轮的 trades / 游标 / metrics / risk_level 放进同一个事务：
+            with db.unit_of_work():
+                db.save_swap_range(...)
+                db.save_metrics(...)
+                db.save_risk_level(...)
+        正常退出时一次 commit（一次 fsync），异常时整体回滚，前端不会读到半轮数据。
+        可以嵌套，只有最外层负责提交。
+        """
+        with self._uow_lock:
+            self._uow_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._uow_depth -= 1
+                if self._uow_depth == 0:
+                    self.conn.rollback()
+                raise
+            else:
+                self._uow_depth -= 1
+                if self._uow_depth == 0:
+                    self.conn.commit()
+
+    # ------------------------------------------------------------------
+    # 交易明细
+    # ------------------------------------------------------------------
+    def save_trades(self, trades: TradesLike, pair_address: Optional[str] = None):
+        if not len(trades):
+            return
+
+        with self._write():
+            self._insert_trades(trades, pair_address)
+
+    def _insert_trades(self, trades: TradesLike, pair_address: Optional[str]):
+        # 没给池子时按空串入库：UNIQUE 里 NULL 互不相等，存 NULL 会让去重失效
+        pair = pair_address.lower() if pair_address else ""
+        batch = as_trade_batch(trades)
+        # 一条 Swap 日志 = (池子, tx, log_index)；同一日志被重组到别的区块时，以最新抓到的为准
+        self.conn.executemany(
+            """
+            INSERT INTO trades(
+                tx_hash,
+                log_index,
+                pair_address,
+                timestamp,
+                block_number,
+                token_in,
+                token_out,
+                amount_in,
+                amount_out,
+                gas_used,
+                gas_price,
+                amount_in_be,
+                amount_in_num,
+                amount_out_be,
+                amount_out_num
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(pair_address, tx_hash, log_index) DO UPDATE SET
+                timestamp = excluded.timestamp,
+                block_number = excluded.block_number
+            """,
+            [
+                (
                     tx_hash,
+                    log_index,
+                    pair,
                     timestamp,
                     block_number,
                     token_in,
                     token_out,
-                    amount_in,
-                    amount_out,
-                    gas_used,
-                    gas_price
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    str(amount_in),
+                    str(amount_out),
+                    str(gas_used),
+                    str(gas_price),
+                    *numeric_pair(amount_in),
+                    *numeric_pair(amount_out),
+                )
+                for (
+                    tx_hash, timestamp, block_number, token_in, token_out,
+                    amount_in, amount_out, gas_used, gas_price, log_index,
+                ) in batch.db_rows()
+            ],
+        )
+
+    # ------------------------------------------------------------------
+    # 增量抓取：游标 + 区间落库（带重组回滚）
+    # ------------------------------------------------------------------
+    def get_ingest_cursor(self, pair_address: str) -> Optional[int]:
+        row = self.conn.execute(
+            "SELECT last_block FROM ingest_cursors WHERE pair_address = ?",
+            (pair_address.lower(),),
+        ).fetchone()
+        return int(row[0]) if row else None
+
+    def save_swap_range(
+        self,
+        pair_address: str,
+        from_block: int,
+        to_block: int,
+        trades: TradesLike,
+        reserves: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """
+        一个事务里完成：
+          1) 删除该池子 [from_block, ∞) 的旧交易和 reserves（可能已被重组）
+          2) 写入本次抓到的 [from_block, to_block] 交易和每个区块的 Sync reserves
+          3) 把游标推进到 to_block
+        """
+        pair = pair_address.lower()
+        with self._write():
+            self.conn.execute(
+                "DELETE FROM trades WHERE pair_address = ? AND block_number >= ?",
+                (pair, int(from_block)),
+            )
+            self.conn.execute(
+                "DELETE FROM pool_reserves WHERE pair_address = ? AND block_number >= ?",
+                (pair, int(from_block)),
+            )
+            if len(trades):
+                self._insert_trades(trades, pair)
+            if reserves:
+                self.conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO pool_reserves (pair_address, block_number, reserve0, reserve1)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    [
+                        (pair, int(r["block_number"]), str(r["reserve0"]), str(r["reserve1"]))
+                        for r in reserves
+                    ],
+                )
+            self.conn.execute(
+                """
+                INSERT INTO ingest_cursors (pair_address, last_block, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(pair_address) DO UPDATE SET
+                    last_block = excluded.last_block,
+                    updated_at = excluded.updated_at
                 """,
-                [
-                    (
-                        t["tx_hash"],
-                        int(t["timestamp"]),
-                        int(t["block_number"]),
-                        t["token_in"],
-                        t["token_out"],
-                        str(t["amount_in"]),
-                        str(t["amount_out"]),
-                        str(t.get("gas_used", 0)),
-                        str(t.get("gas_price", 0)),
-                    )
-                    for t in trades
-                ],
+                (pair, int(to_block)),
+            )
+
+    def load_reserves_at(self, pair_address: str, block_number: Optional[int] = None) -> Optional[Dict[str, int]]:
+        """
+        返回 block_number（默认最新）时刻池子的 reserves，即该区块及之前最后一个 Sync 的值。
+        没有任何 Sync 记录时返回 None。
+        """
+        sql = """
+            SELECT block_number, reserve0, reserve1
+            FROM pool_reserves
+            WHERE pair_address = ?
+        """
+        params: List[Any] = [pair_address.lower()]
+        if block_number is not None:
+            sql += " AND block_number <= ?"
+            params.append(int(block_number))
+        sql += " ORDER BY block_number DESC LIMIT 1"
+
+        row = self.conn.execute(sql, params).fetchone()
+        if not row:
+            return None
+        return {"block_number": int(row[0]), "reserve0": int(row[1]), "reserve1": int(row[2])}
+
+    def load_reserve_series(self, pair_address: str, from_block: int, to_block: int) -> List[Dict[str, int]]:
+        """[from_block, to_block] 内每个有 Sync 的区块的 reserves（按区块升序），用于回测 / 窗口内指标。"""
+        rows = self.conn.execute(
+            """
+            SELECT block_number, reserve0, reserve1
+            FROM pool_reserves
+            WHERE pair_address = ? AND block_number BETWEEN ? AND ?
+            ORDER BY block_number ASC
+            """,
+            (pair_address.lower(), int(from_block), int(to_block)),
+        ).fetchall()
+        return [
+            {"block_number": int(b), "reserve0": int(r0), "reserve1": int(r1)}
+            for b, r0, r1 in rows
+        ]
+
+    def load_trades(self, pair_address: str, from_block: int) -> TradeBatch:
+        """读出该池子 from_block 之后已入库的交易（按区块升序），amount 精确还原成 int。"""
+        rows = self.conn.execute(
+            """
+            SELECT block_number, timestamp, tx_hash, log_index, token_in, amount_in_be, amount_out_be
+            FROM trades
+            WHERE pair_address = ? AND block_number >= ?
+            ORDER BY block_number ASC, log_index ASC, id ASC
+            """,
+            (pair_address.lower(), int(from_block)),
+        ).fetchall()
+
+        batch = TradeBatch()
+        for block_number, timestamp, tx_hash, log_index, token_in, amount_in_be, amount_out_be in rows:
+            batch.append(
+                block_number=block_number,
+                timestamp=timestamp or 0,
+                tx_hash=tx_hash,
+                log_index=log_index or 0,
+                token_in=token_in,
+                amount_in=decode_int(amount_in_be),
+                amount_out=decode_int(amount_out_be),
             )
+        return batch
+
+    def load_trade_window(self, pair_address: str, from_block: int) -> Tuple[int, int]:
+        """从已入库的交易里统计窗口指标，返回 (dex_volume, dex_trades)。"""
+        batch = self.load_trades(pair_address, from_block)
+        return batch.total_amount_in(), len(batch)
 
     # ------------------------------------------------------------------
     # 风险等级（给前端用）
     # ------------------------------------------------------------------
     def save_risk_level(self, market_id: str, level: int, source: str = "local"):
-        c = self.conn.cursor()
-        c.execute(
-            """
-            INSERT INTO risk_levels (market_id, level, source)
-            VALUES (?, ?, ?)
-            """,
-            (market_id, int(level), source),
-        )
-        self.conn.commit()
+        with self._write():
+            cur = self.conn.execute(
+                """
+                INSERT INTO risk_levels (market_id, level, source)
+                VALUES (?, ?, ?)
+                """,
+                (market_id, int(level), source),
+            )
+            # 同一事务里累加进各分辨率的 rollup 桶
+            self.conn.execute(SQL_ROLLUP_LEVEL_ROW, (cur.lastrowid,))
 
     # ------------------------------------------------------------------
     # 多因子原始指标：保存 & 读取（动态分位打分会用到）
@@ -147,8 +730,8 @@ class MonitorDatabase:
         cex_net_inflow = int(metrics.get("cex_net_inflow", 0) or 0)
         pool_liquidity = int(metrics.get("pool_liquidity", 0) or 0)
 
-        with self.conn:
-            self.conn.execute(
+        with self._write():
+            cur = self.conn.execute(
                 """
                 INSERT INTO risk_metrics (
                     market_id,
@@ -157,35 +740,48 @@ class MonitorDatabase:
                     whale_sell_total,
                     whale_count_selling,
                     cex_net_inflow,
-                    pool_liquidity
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    pool_liquidity,
+                    dex_volume_be,
+                    dex_volume_num,
+                    whale_sell_total_be,
+                    whale_sell_total_num,
+                    cex_net_inflow_be,
+                    cex_net_inflow_num,
+                    pool_liquidity_be,
+                    pool_liquidity_num
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 (
                     market_id,
-                    str(dex_volume),          # 大整数转字符串
+                    str(dex_volume),          # 大整数转字符串（兼容旧读取方）
                     dex_trades,
                     str(whale_sell_total),
                     whale_count_selling,
                     str(cex_net_inflow),
                     str(pool_liquidity),
+                    *numeric_pair(dex_volume),
+                    *numeric_pair(whale_sell_total),
+                    *numeric_pair(cex_net_inflow),
+                    *numeric_pair(pool_liquidity),
                 ),
             )
+            self.conn.execute(SQL_ROLLUP_METRICS_ROW, (cur.lastrowid,))
 
     def load_recent_metrics(self, market_id: str, limit: int = 500) -> List[Dict[str, Any]]:
         """
-        返回最近 limit 条历史指标，**全部转成 int**，
+        返回最近 limit 条历史指标，**全部是 int**（从 *_be 列精确解码），
         确保 compute_risk_level_dynamic / percentile_rank 不会出现 str <= int 的问题。
         """
         c = self.conn.cursor()
         c.execute(
             """
             SELECT
-                dex_volume,
+                dex_volume_be,
                 dex_trades,
-                whale_sell_total,
+                whale_sell_total_be,
                 whale_count_selling,
-                cex_net_inflow,
-                pool_liquidity
+                cex_net_inflow_be,
+                pool_liquidity_be
             FROM risk_metrics
             WHERE market_id = ?
             ORDER BY id DESC
@@ -198,64 +794,138 @@ class MonitorDatabase:
         # rows 现在是从“最新 → 最旧”，反转成“最旧 → 最新”方便做时间序列分析
         rows.reverse()
 
-        history: List[Dict[str, Any]] = []
-        for row in rows:
-            (
-                dex_volume_raw,
-                dex_trades_raw,
-                whale_sell_total_raw,
-                whale_count_selling_raw,
-                cex_net_inflow_raw,
-                pool_liquidity_raw,
-            ) = row
-
-            # 小心一点：任何异常都兜底成 0，避免线上崩溃
-            try:
-                dex_volume = int(dex_volume_raw)
-            except Exception:
-                dex_volume = 0
+        return [
+            {
+                "dex_volume": decode_int(dex_volume),
+                "dex_trades": int(dex_trades or 0),
+                "whale_sell_total": decode_int(whale_sell_total),
+                "whale_count_selling": int(whale_count_selling or 0),
+                "cex_net_inflow": decode_int(cex_net_inflow),
+                "pool_liquidity": decode_int(pool_liquidity),
+            }
+            for (
+                dex_volume,
+                dex_trades,
+                whale_sell_total,
+                whale_count_selling,
+                cex_net_inflow,
+                pool_liquidity,
+            ) in rows
+        ]
 
-            try:
-                dex_trades = int(dex_trades_raw)
-            except Exception:
-                dex_trades = 0
+    # ------------------------------------------------------------------
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
 
-            try:
-                whale_sell_total = int(whale_sell_total_raw)
-            except Exception:
-                whale_sell_total = 0
 
-            try:
-                whale_count_selling = int(whale_count_selling_raw)
-            except Exception:
-                whale_count_selling = 0
+# ----------------------------------------------------------------------
+# 只读连接池：给 Flask API 用，有界队列里最多 pool_size 条 URI mode=ro 连接，按查询借出 / 归还
+# ----------------------------------------------------------------------
 
-            try:
-                cex_net_inflow = int(cex_net_inflow_raw)
-            except Exception:
-                cex_net_inflow = 0
+class ReadOnlyDatabase:
+    """
+    API 侧的只读访问：
+      - 一个有界连接池（queue.Queue），最多 pool_size 条 `file:...?mode=ro` 连接，
+        check_same_thread=False，每次查询借出、用完归还；Werkzeug threaded=True
+        每个请求一个新线程也不会重新建连
+      - 只读连接不会跑建表 / 迁移 DDL，也不会抢写锁；WAL 下不阻塞监控写入
+      - sqlite3 按 SQL 文本缓存已编译语句（cached_statements），
+        调用方用固定的 SQL 常量即可复用预编译语句
+    """
 
-            try:
-                pool_liquidity = int(pool_liquidity_raw)
-            except Exception:
-                pool_liquidity = 0
-
-            history.append(
-                {
-                    "dex_volume": dex_volume,
-                    "dex_trades": dex_trades,
-                    "whale_sell_total": whale_sell_total,
-                    "whale_count_selling": whale_count_selling,
-                    "cex_net_inflow": cex_net_inflow,
-                    "pool_liquidity": pool_liquidity,
-                }
-            )
+    def __init__(
+        self,
+        db_path: Path | str = DB_PATH,
+        cached_statements: int = 128,
+        pool_size: int = 8,
+        checkout_timeout: float = 10.0,
+    ):
+        self.db_path = Path(db_path).resolve()
+        self.cached_statements = cached_statements
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self._idle: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=pool_size)
+        # 已打开（空闲 + 借出）的连接数
+        self._opened = 0
+        self._lock = threading.Lock()
 
-        return history
+    def exists(self) -> bool:
+        return self.db_path.exists()
 
-    # ------------------------------------------------------------------
-    def close(self):
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"{self.db_path.as_uri()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA query_only = 1")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute("PRAGMA cache_size = -16000")
+        conn.execute(f"PRAGMA mmap_size = {256 * 1024 * 1024}")
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection):
+        with self._lock:
+            self._opened -= 1
         try:
-            self.conn.close()
+            conn.close()
         except Exception:
-            pass
\ No newline at end of file
+            pass
+
+    @contextmanager
+    def connection(self):
+        """
+        借出一条连接：有空闲的直接用，没有且未到上限就新开，否则等别人归还。
+        查询出错的连接直接关闭丢弃，不放回池子。
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.pool_size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except BaseException:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.checkout_timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError("只读连接池已满，等待空闲连接超时")
+
+        try:
+            yield conn
+        except sqlite3.Error:
+            self._discard(conn)
+            raise
+        except BaseException:
+            self._idle.put_nowait(conn)
+            raise
+        else:
+            self._idle.put_nowait(conn)
+
+    def reset(self):
+        """关闭所有空闲连接（例如数据库文件被替换后），之后按需重新打开。"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+    def query(self, sql: str, params: Any = ()) -> List[tuple]:
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def query_one(self, sql: str, params: Any = ()) -> Optional[tuple]:
+        rows = self.query(sql, params)
+        return rows[0] if rows else None
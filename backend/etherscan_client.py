@@ -0,0 +1,217 @@
+# backend/etherscan_client.py
+"""
+共享的 Etherscan V2 客户端：
+  - 一个 keep-alive 的 requests.Session
+  - 令牌桶限速（默认 5 req/s，按 API 套餐用 ETHERSCAN_RATE_LIMIT 调整）
+  - 遇到限流 / 网络错误时带抖动的指数退避重试
+  - txlist 超过 10k 条时自动按区块向后翻页
+  - 每个地址缓存一段已确认（距链头超过 ETHERSCAN_FINALITY_DEPTH）的交易，
+    滚动窗口每轮只拉新增的尾巴
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from lru import LRU
+
+ETHERSCAN_API_KEY = os.getenv("ETHERSCAN_API_KEY", "")
+ETHERSCAN_BASE_URL = "https://api.etherscan.io/v2/api"
+ETH_MAINNET_CHAIN_ID = "1"  # 只监控以太坊主网
+
+# 免费套餐 5 req/s；付费套餐可在 .env 里调高
+ETHERSCAN_RATE_LIMIT = float(os.getenv("ETHERSCAN_RATE_LIMIT", "5"))
+# Etherscan 规定 page * offset <= 10000
+ETHERSCAN_MAX_RESULTS = 10_000
+# 离请求的 end_block 超过这么多区块的交易视为已确认，可以缓存；更新的部分每次重拉
+ETHERSCAN_FINALITY_DEPTH = 64
+
+
+class EtherscanRateLimited(Exception):
+    """Etherscan 返回了限流提示（HTTP 429 或 result 里的 rate limit 文案）。"""
+
+
+class TokenBucket:
+    """线程安全的令牌桶：容量 burst，每秒补充 rate 个令牌。"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class EtherscanClient:
+    def __init__(
+        self,
+        api_key: str = ETHERSCAN_API_KEY,
+        rate_limit: float = ETHERSCAN_RATE_LIMIT,
+        max_retries: int = 5,
+        cache_size: int = 256,
+    ):
+        self.api_key = api_key
+        self.bucket = TokenBucket(rate_limit)
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+
+        # address -> (from_block, to_block, txs)：该地址在 [from_block, to_block] 内已确认的交易，
+        # 每个地址只留一段，按地址数 LRU 淘汰
+        self._cache: LRU = LRU(maxsize=cache_size)
+        self._cache_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 单次请求：限速 + 抖动退避重试
+    # ------------------------------------------------------------------
+    def _request(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        params = {"apikey": self.api_key, "chainid": ETH_MAINNET_CHAIN_ID, **params}
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                resp = self.session.get(ETHERSCAN_BASE_URL, params=params, timeout=15)
+                if resp.status_code == 429:
+                    raise EtherscanRateLimited("HTTP 429")
+                resp.raise_for_status()
+                data = resp.json()
+
+                result = data.get("result")
+                if data.get("status") != "1" and isinstance(result, str) and "rate limit" in result.lower():
+                    raise EtherscanRateLimited(result)
+                return data
+            except (EtherscanRateLimited, requests.RequestException) as e:
+                if attempt >= self.max_retries:
+                    raise
+                # 指数退避 + 全抖动，避免多个线程同时重试又撞上限流
+                backoff = random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+                print(f"⚠️ Etherscan 请求失败（{e}），{backoff:.1f}s 后第 {attempt + 1} 次重试")
+                time.sleep(backoff)
+
+        raise RuntimeError("unreachable")
+
+    # ------------------------------------------------------------------
+    # txlist：自动翻页 + 已确认区段缓存
+    # ------------------------------------------------------------------
+    def get_normal_txs(
+        self,
+        address: str,
+        start_block: int,
+        end_block: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        返回 address 在 [start_block, end_block] 内的全部普通 ETH 交易（升序）。
+        缓存里已有 [start_block, X] 的已确认交易时只去拉 (X, end_block] 这段尾巴。
+        每次返回新的 list，调用方随意修改也不会污染缓存。
+        """
+        if not self.api_key:
+            print("⚠️ 未配置 ETHERSCAN_API_KEY，跳过 Etherscan 请求")
+            return []
+
+        addr = address.lower()
+        start_block, end_block = int(start_block), int(end_block)
+
+        with self._cache_lock:
+            cached: Optional[Tuple[int, int, Tuple[Dict[str, Any], ...]]] = self._cache.get(addr)
+
+        if cached is not None and cached[0] <= start_block <= cached[1] + 1:
+            _, cached_to, cached_txs = cached
+            head = [tx for tx in cached_txs if start_block <= int(tx.get("blockNumber") or 0) <= end_block]
+            fetch_from = cached_to + 1
+        else:
+            head = []
+            fetch_from = start_block
+
+        txs = head + self._fetch_txlist(address, fetch_from, end_block)
+
+        # 只缓存已确认的部分，且只保留本次窗口，内存随窗口滚动而不是随轮数增长
+        finalized_to = min(end_block, end_block - ETHERSCAN_FINALITY_DEPTH)
+        if finalized_to >= start_block:
+            finalized = tuple(tx for tx in txs if int(tx.get("blockNumber") or 0) <= finalized_to)
+            with self._cache_lock:
+                self._cache[addr] = (start_block, finalized_to, finalized)
+        return txs
+
+    def _fetch_txlist(self, address: str, start_block: int, end_block: int) -> List[Dict[str, Any]]:
+        """
+        实际请求 txlist。单次最多 10k 条；满 10k 时从最后一条的区块号继续拉，并按 hash 去重。
+        """
+        txs: List[Dict[str, Any]] = []
+        seen: set[str] = set()
+        cursor = int(start_block)
+
+        while cursor <= end_block:
+            data = self._request(
+                {
+                    "module": "account",
+                    "action": "txlist",
+                    "address": address,
+                    "startblock": cursor,
+                    "endblock": end_block,
+                    "page": 1,
+                    "offset": ETHERSCAN_MAX_RESULTS,
+                    "sort": "asc",
+                }
+            )
+            status = data.get("status")
+            result = data.get("result")
+
+            if status != "1" or not isinstance(result, list):
+                # 没有交易：不算错误
+                if isinstance(result, str) and "No transactions found" in result:
+                    break
+                raise RuntimeError(f"Etherscan 返回非成功状态: {data}")
+
+            for tx in result:
+                h = tx.get("hash")
+                if h in seen:
+                    continue
+                seen.add(h)
+                txs.append(tx)
+
+            if len(result) < ETHERSCAN_MAX_RESULTS:
+                break
+
+            # 这一页满了：从最后一个区块重新开始（该区块可能没拉全，靠 hash 去重）
+            last_block = int(result[-1].get("blockNumber") or cursor)
+            if last_block <= cursor:
+                # 单个区块内就超过 10k 条，无法继续细分
+                print(f"⚠️ {address} 在区块 {cursor} 内交易超过 {ETHERSCAN_MAX_RESULTS} 条，结果可能不完整")
+                break
+            cursor = last_block
+
+        return txs
+
+
+_default_client: Optional[EtherscanClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_etherscan_client() -> EtherscanClient:
+    """进程内共享一个客户端，让所有调用方共用同一个限速桶和缓存。"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = EtherscanClient()
+        return _default_client
@@ -0,0 +1,191 @@
+# backend/log_scanner.py
+"""
+并发 eth_getLogs 区间扫描器（collect_eth_whales 等长区间扫描用）：
+  - 固定大小的线程池，同时在途的请求数不超过 workers
+  - 每个新任务的区间长度按已观测到的日志密度（条 / 区块）估算，
+    目标是每次请求返回 target_logs 条左右：稀疏区间自动放大步长，密集区间自动缩小
+  - 触发 -32005（超过 10000 条）时把该区间对半拆开重新入队；其它错误退避重试，
+    超过重试次数的区间作为失败区间返回，不会被静默跳过
+  - on_range 回调始终在调用线程里串行执行，回调里可以放心地聚合 / 落盘
+  - scan_log_ranges 一次扫多个不相邻的区间（例如检查点之间的缺口），
+    密度估计在区间之间延续；子区间不会跨越调用方给的区间边界
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from web3 import Web3
+
+SCAN_WORKERS = int(os.getenv("LOG_SCAN_WORKERS", "8"))
+# 单次请求期望返回的日志条数，离 10000 上限留出余量
+SCAN_TARGET_LOGS = 5000
+SCAN_MAX_RETRIES = 5
+
+# (from_block, to_block)
+BlockRange = Tuple[int, int]
+
+
+def is_too_many_results(e: BaseException) -> bool:
+    """web3 把 RPC 错误塞在 e.args[0] 里（通常是 dict）；典型为 -32005 / more than 10000 results。"""
+    err_obj = e.args[0] if e.args else {}
+    msg = str(e)
+    code = None
+    if isinstance(err_obj, dict):
+        code = err_obj.get("code")
+        msg = err_obj.get("message", msg)
+    return code == -32005 or "more than 10000 results" in msg
+
+
+class _DensityEstimator:
+    """日志密度的指数滑动平均，用来给下一个任务定步长。"""
+
+    def __init__(self, initial_step: int, target_logs: int, min_step: int, max_step: int, alpha: float = 0.3):
+        self.target_logs = target_logs
+        self.min_step = min_step
+        self.max_step = max_step
+        self.alpha = alpha
+        self.density: Optional[float] = None
+        self.initial_step = initial_step
+
+    def observe(self, blocks: int, logs: int):
+        d = logs / max(blocks, 1)
+        self.density = d if self.density is None else self.alpha * d + (1 - self.alpha) * self.density
+
+    def next_step(self) -> int:
+        if self.density is None:
+            return self.initial_step
+        if self.density <= 0:
+            return self.max_step
+        return max(self.min_step, min(self.max_step, int(self.target_logs / self.density)))
+
+
+def scan_logs(
+    w3: Web3,
+    log_filter: Dict[str, Any],
+    start_block: int,
+    end_block: int,
+    on_range: Callable[[int, int, List[Any]], None],
+    workers: int = SCAN_WORKERS,
+    initial_step: int = 2000,
+    min_step: int = 1,
+    max_step: int = 100_000,
+    target_logs: int = SCAN_TARGET_LOGS,
+    max_retries: int = SCAN_MAX_RETRIES,
+) -> List[BlockRange]:
+    """
+    并发扫描 [start_block, end_block]，每个成功的子区间调用一次 on_range(from, to, logs)。
+    子区间完成顺序不保证递增。log_filter 里不要带 fromBlock / toBlock。
+
+    返回重试多次仍失败的区间列表（空列表表示整段都扫完了）。
+    """
+    return scan_log_ranges(
+        w3,
+        log_filter,
+        [(start_block, end_block)],
+        on_range,
+        workers=workers,
+        initial_step=initial_step,
+        min_step=min_step,
+        max_step=max_step,
+        target_logs=target_logs,
+        max_retries=max_retries,
+    )
+
+
+def scan_log_ranges(
+    w3: Web3,
+    log_filter: Dict[str, Any],
+    ranges: List[BlockRange],
+    on_range: Callable[[int, int, List[Any]], None],
+    workers: int = SCAN_WORKERS,
+    initial_step: int = 2000,
+    min_step: int = 1,
+    max_step: int = 100_000,
+    target_logs: int = SCAN_TARGET_LOGS,
+    max_retries: int = SCAN_MAX_RETRIES,
+) -> List[BlockRange]:
+    """
+    同 scan_logs，但一次扫描多个闭区间，共用一个线程池和一个密度估计。
+    每个子区间都落在某一个输入区间之内，调用方可以按输入区间统计完成度。
+    """
+    pending: Deque[BlockRange] = deque(sorted((lo, hi) for lo, hi in ranges if hi >= lo))
+    if not pending:
+        return []
+
+    density = _DensityEstimator(initial_step, target_logs, min_step, max_step)
+    # 失败 / 拆分后需要重扫的子区间：(from, to, 已重试次数, 最早可重试时间)
+    retry_queue: Deque[Tuple[int, int, int, float]] = deque()
+    failed: List[BlockRange] = []
+    # 当前正在切分的输入区间，frontier 是其中还没分配出去的第一个区块
+    frontier, range_end = pending.popleft()
+
+    def fetch(from_block: int, to_block: int) -> List[Any]:
+        return w3.eth.get_logs({**log_filter, "fromBlock": from_block, "toBlock": to_block})
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="logscan") as pool:
+        in_flight: Dict[Any, Tuple[int, int, int]] = {}
+
+        while in_flight or retry_queue or frontier <= range_end:
+            # 1) 把空闲的并发名额填满：优先重扫队列，其次按估算步长切新区间
+            now = time.time()
+            while len(in_flight) < workers:
+                if retry_queue and retry_queue[0][3] <= now:
+                    lo, hi, attempts, _ = retry_queue.popleft()
+                elif frontier <= range_end:
+                    lo = frontier
+                    hi = min(frontier + density.next_step() - 1, range_end)
+                    attempts = 0
+                    frontier = hi + 1
+                    if frontier > range_end and pending:
+                        frontier, range_end = pending.popleft()
+                else:
+                    break
+                in_flight[pool.submit(fetch, lo, hi)] = (lo, hi, attempts)
+
+            if not in_flight:
+                # 只剩还在退避中的重试任务
+                time.sleep(max(0.0, min(t for *_, t in retry_queue) - time.time()))
+                continue
+
+            done, _ = wait(list(in_flight), timeout=1.0, return_when=FIRST_COMPLETED)
+
+            # 2) 处理完成的请求
+            for fut in done:
+                lo, hi, attempts = in_flight.pop(fut)
+                blocks = hi - lo + 1
+                try:
+                    part = fut.result()
+                except ValueError as e:
+                    if is_too_many_results(e) and blocks > 1:
+                        # 按 >10000 条计入密度，后续新任务的步长会跟着缩小
+                        density.observe(blocks, 10_000)
+                        mid = lo + blocks // 2
+                        retry_queue.appendleft((mid, hi, attempts, 0.0))
+                        retry_queue.appendleft((lo, mid - 1, attempts, 0.0))
+                        print(f"  ↪️ 区间 [{lo}, {hi}] 超过 10000 条，拆成两段重扫")
+                        continue
+                    part = e
+                except Exception as e:
+                    part = e
+
+                if isinstance(part, BaseException):
+                    if attempts + 1 >= max_retries:
+                        print(f"  ❌ 区间 [{lo}, {hi}] 重试 {max_retries} 次仍失败: {part}")
+                        failed.append((lo, hi))
+                    else:
+                        delay = min(30.0, 2 ** attempts)
+                        print(f"  ⚠️ 区间 [{lo}, {hi}] 失败，{delay:.0f}s 后重试: {part}")
+                        retry_queue.append((lo, hi, attempts + 1, time.time() + delay))
+                    continue
+
+                density.observe(blocks, len(part))
+                print(f"  · 区块区间 [{lo}, {hi}] ok, 本段日志数={len(part)}")
+                on_range(lo, hi, part)
+
+    failed.sort()
+    return failed
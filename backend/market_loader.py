@@ -2,13 +2,25 @@
 """
 统一加载 markets.json + auto_whales.json（+ 预留 auto_cex.json），
 对外暴露 load_markets()，供 monitor.py 等模块使用。
+
+写入方（collect_eth_whales 等）用 markets_file_lock + atomic_write_json：
+先写同目录临时文件并 fsync，再 os.replace 原子替换，读方永远看不到写了一半的文件。
+MarketsWatcher 按 mtime 监视这几个文件，变化时重新加载并预先构建巨鲸 / CEX 地址集合。
 """
 
 from __future__ import annotations
 
 import json
+import os
+import tempfile
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, FrozenSet, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只保留原子替换
+    fcntl = None
 
 BASE_DIR = Path(__file__).resolve().parent
 MARKETS_PATH = BASE_DIR / "markets.json"
@@ -25,6 +37,52 @@ def _safe_load_json(path: Path) -> Any:
         return None
 
 
+# ----------------------------------------------------------------------
+# 文件锁 + 原子写入
+# ----------------------------------------------------------------------
+@contextmanager
+def markets_file_lock(path: Path = MARKETS_PATH, shared: bool = False):
+    """
+    对 <path>.lock 加 flock（不锁文件本身，因为它会被 os.replace 换掉）。
+    读-改-写整个过程要持有排他锁，避免两个写入方互相覆盖。
+    """
+    lock_path = Path(str(path) + ".lock")
+    with open(lock_path, "a+") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write_json(path: Path, data: Any):
+    """写临时文件 → fsync → os.replace → fsync 目录；中途崩溃时原文件保持不变。"""
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json.dumps(data, indent=2))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+    # 让 rename 本身也落盘
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(str(path.parent), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
 def load_markets() -> List[Dict[str, Any]]:
     """
     返回合并后的 market 配置数组。
@@ -77,6 +135,77 @@ def load_markets() -> List[Dict[str, Any]]:
     return base
 
 
+# ----------------------------------------------------------------------
+# 热加载：按 mtime 监视配置文件，变化时重建地址集合
+# ----------------------------------------------------------------------
+WATCHED_PATHS = (MARKETS_PATH, AUTO_WHALES_PATH, AUTO_CEX_PATH)
+
+
+def _is_eth_address(addr: Any) -> bool:
+    return isinstance(addr, str) and addr.startswith("0x") and len(addr) == 42
+
+
+def build_watch_sets(markets: List[Dict[str, Any]]) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """主网巨鲸 / 交易所热钱包地址（小写）的不可变集合，加载时构建一次，各轮直接复用。"""
+    whales = set()
+    cex = set()
+    for m in markets:
+        if m.get("network", "mainnet") != "mainnet":
+            continue
+        addr = m.get("address")
+        if not _is_eth_address(addr):
+            continue
+        t = m.get("type")
+        if t in ("whale_eth", "whale"):
+            whales.add(addr.lower())
+        if t in ("exchange_eth", "exchange"):
+            cex.add(addr.lower())
+    return frozenset(whales), frozenset(cex)
+
+
+class MarketsWatcher:
+    """
+    用法：
+        watcher = MarketsWatcher()
+        ...
+        if watcher.poll():   # 每轮调用一次，只 stat 文件，没变化时几乎没有开销
+            use(watcher.markets, watcher.whales, watcher.cex_addresses)
+    """
+
+    def __init__(self, paths: Tuple[Path, ...] = WATCHED_PATHS):
+        self.paths = paths
+        self._signature: Optional[Tuple] = None
+        self.markets: List[Dict[str, Any]] = []
+        self.whales: FrozenSet[str] = frozenset()
+        self.cex_addresses: FrozenSet[str] = frozenset()
+        self.reload()
+
+    def _stat_signature(self) -> Tuple:
+        sig = []
+        for p in self.paths:
+            try:
+                st = os.stat(p)
+                sig.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except FileNotFoundError:
+                sig.append(None)
+        return tuple(sig)
+
+    def reload(self):
+        signature = self._stat_signature()
+        with markets_file_lock(MARKETS_PATH, shared=True):
+            markets = load_markets()
+        self.markets = markets
+        self.whales, self.cex_addresses = build_watch_sets(markets)
+        self._signature = signature
+
+    def poll(self) -> bool:
+        """配置文件有变化则重新加载并返回 True。"""
+        if self._stat_signature() == self._signature:
+            return False
+        self.reload()
+        return True
+
+
 if __name__ == "__main__":
     # 简单打印一下合并后的结果，方便调试
     markets = load_markets()
@@ -2,16 +2,19 @@
 
 import os
 import time
-import json
-from typing import Dict, Any, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, FrozenSet, List, Optional, Callable, Tuple
 
 from dotenv import load_dotenv
 from web3 import Web3
 
-from config import load_risk_monitor_contract
+from config import load_risk_monitor_contract, make_web3
 from db import MonitorDatabase
-from chain_data import fetch_recent_swaps
-from whale_cex import fetch_whale_metrics, fetch_cex_net_inflow, estimate_pool_liquidity
+from market_loader import MarketsWatcher
+from chain_data import fetch_pair_logs_range
+from whale_cex import fetch_whale_cex_metrics, estimate_pool_liquidity, liquidity_from_reserves
+from multicall import fetch_pool_reserves
+from rolling_rank import MetricsRankEngine
 
 load_dotenv()
 
@@ -22,6 +25,15 @@ load_dotenv()
 RISK_CONFIG: Dict[str, Any] = {
     "poll_interval": 60,
     "blocks_back": 2000,
+    # 增量抓取时每轮回退的确认深度，用来覆盖链重组
+    "confirmation_depth": 12,
+
+    # 各因子并发采集的单独超时（秒），超时或失败按 0 处理
+    "factor_timeouts": {
+        "swaps": 40,
+        "whale_cex": 60,
+        "liquidity": 20,
+    },
 
     "min_update_interval_sec": 5 * 60,
     "min_stable_rounds_for_update": 2,
@@ -48,42 +60,25 @@ RISK_CONFIG: Dict[str, Any] = {
         "max_score": 30,
     },
     "level_thresholds": [20, 40, 70],
-}
-
-SCRIPT_DIR = os.path.dirname(__file__)
-MARKETS_PATH = os.path.join(SCRIPT_DIR, "markets.json")
-
 
-def load_markets() -> List[Dict[str, Any]]:
-    with open(MARKETS_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def get_default_dex_market(markets: List[Dict[str, Any]]) -> Dict[str, Any]:
-    for m in markets:
-        if m.get("type") == "dex_pool" and m.get("network", "mainnet") == "mainnet":
-            return m
-    for m in markets:
-        if m.get("type") == "dex_pool":
-            return m
-    raise RuntimeError("markets.json 中没有 type == 'dex_pool' 的市场配置，请先配置一个 DEX 池子。")
+    # 动态分位打分的滚动窗口长度 & 启用所需的最少历史条数
+    "history_window": 500,
+    "min_history_for_dynamic": 30,
+}
 
 
 def calc_market_id(label: str) -> bytes:
     return Web3.keccak(text=label)
 
 
-def is_valid_eth_address(addr: str) -> bool:
-    return isinstance(addr, str) and addr.startswith("0x") and len(addr) == 42
-
-
 def send_update_risk_tx(w3: Web3, contract, level: int, market_id: bytes) -> str:
     private_key = os.getenv("PRIVATE_KEY")
     if not private_key:
         raise RuntimeError("请在 .env 中配置 PRIVATE_KEY（建议用测试网私钥）")
 
     account = w3.eth.account.from_key(private_key)
-    nonce = w3.eth.get_transaction_count(account.address)
+    # 多个市场可能在同一轮里连续发交易，用 pending nonce 避免撞号
+    nonce = w3.eth.get_transaction_count(account.address, "pending")
 
     tx = contract.functions.updateRisk(market_id, level).build_transaction(
         {
@@ -100,6 +95,110 @@ def send_update_risk_tx(w3: Web3, contract, level: int, market_id: bytes) -> str
     return tx_hash.hex()
 
 
+# ----------------------------------------------------------------------
+# 3. 增量抓取 Swap：按游标只拉新区块，窗口指标从库里算
+# ----------------------------------------------------------------------
+
+def fetch_swap_delta(
+    pair_address: str,
+    cursor: Optional[int],
+    blocks_back: int,
+    network: str = "mainnet",
+) -> Dict[str, Any]:
+    """
+    只抓不写（可以放到工作线程里跑）：从游标（回退 confirmation_depth 个区块以覆盖重组）
+    抓到最新区块，返回 {"from_block", "to_block", "window_start", "trades", "reserves"}。
+    cursor 由调用方在主线程里先读好。
+    """
+    latest = make_web3(network).eth.block_number
+    window_start = max(0, latest - blocks_back)
+
+    if cursor is None:
+        from_block = window_start
+    else:
+        depth = RISK_CONFIG["confirmation_depth"]
+        from_block = max(window_start, cursor + 1 - depth)
+
+    # Swap 和 Sync 一次 eth_getLogs 拿回来
+    trades, reserves = fetch_pair_logs_range(pair_address, from_block, latest, network=network)
+    return {
+        "from_block": from_block,
+        "to_block": latest,
+        "window_start": window_start,
+        "trades": trades,
+        "reserves": reserves,
+    }
+
+
+def store_swap_delta(db: MonitorDatabase, pair_address: str, delta: Dict[str, Any]) -> int:
+    """在调用线程里把 fetch_swap_delta 的结果落库（trades + reserves + 游标），返回窗口起点。"""
+    db.save_swap_range(
+        pair_address,
+        delta["from_block"],
+        delta["to_block"],
+        delta["trades"],
+        delta["reserves"],
+    )
+    print(f"📥 增量抓取区块 [{delta['from_block']}, {delta['to_block']}]，游标推进到 {delta['to_block']}")
+    return delta["window_start"]
+
+
+# ----------------------------------------------------------------------
+# 3.1 并发采集各因子：每个因子单独超时，失败回落到默认值
+# ----------------------------------------------------------------------
+
+# 超时的任务不会被强杀，会继续占着线程直到返回，所以线程数留一些余量
+_factor_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="factor")
+
+
+def collect_factors(
+    collectors: Dict[str, Tuple[Any, Any]],
+    timeouts: Dict[str, float],
+) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    collectors: {因子名: (采集函数 或 已提交的 Future, 失败时的默认值)}
+    所有因子同时开始，各自按 timeouts[因子名] 计时。
+    采集函数只能抓数据、不能有副作用（尤其不能写库）：超时的任务不会被取消，
+    它晚到的结果会被丢弃，写库统一由调用方在拿到结果后做。
+    返回 (结果, 每个因子耗时秒数)。
+    """
+    start = time.time()
+    finished_at: Dict[str, float] = {}
+
+    def _timed(name: str, fn: Callable[[], Any]) -> Any:
+        try:
+            return fn()
+        finally:
+            finished_at[name] = time.time()
+
+    futures = {
+        name: fn if isinstance(fn, Future) else _factor_executor.submit(_timed, name, fn)
+        for name, (fn, _) in collectors.items()
+    }
+
+    results: Dict[str, Any] = {}
+    latencies: Dict[str, float] = {}
+    for name, fut in futures.items():
+        default = collectors[name][1]
+        deadline = start + timeouts.get(name, 60)
+        try:
+            results[name] = fut.result(timeout=max(0.0, deadline - time.time()))
+        except FutureTimeoutError:
+            print(f"⚠️ 因子 {name} 超过 {timeouts.get(name, 60)} 秒未返回，本轮按 0 处理")
+            results[name] = default
+        except Exception as e:
+            print(f"⚠️ 因子 {name} 采集失败，本轮按 0 处理: {e}")
+            results[name] = default
+        latencies[name] = finished_at.get(name, time.time()) - start
+
+    print(
+        "⏱️ 因子耗时: "
+        + ", ".join(f"{name}={sec:.2f}s" for name, sec in latencies.items())
+        + f" (本轮采集总计 {time.time() - start:.2f}s)"
+    )
+    return results, latencies
+
+
 # ----------------------------------------------------------------------
 # 4. 原有静态打分逻辑（保留，用作历史不足时的 fallback）
 # ----------------------------------------------------------------------
@@ -208,25 +307,6 @@ def compute_risk_level_static(metrics: Dict[str, Any]) -> int:
 # 4.1 ✅ 动态化方案 1：滚动窗口 + 百分位打分
 # ----------------------------------------------------------------------
 
-def percentile_rank(history: List[int], value: int) -> float:
-    """
-    简单百分位实现：历史中 <= 当前值 的比例 * 100
-    history: 历史样本（长度 N）
-    value: 当前这一次的值
-    """
-    if not history:
-        return 50.0  # 没历史就视为中位
-
-    sorted_hist = sorted(history)
-    count = 0
-    for v in sorted_hist:
-        if v <= value:
-            count += 1
-        else:
-            break
-    return count / len(sorted_hist) * 100.0
-
-
 def score_from_percentile(p: float) -> int:
     """
     把百分位 p ∈ [0,100] 映射到一个因子得分：
@@ -245,45 +325,86 @@ def score_from_percentile(p: float) -> int:
         return 30
 
 
+# (market_id_hex, history_window) -> 常驻内存的滚动百分位引擎
+_rank_engines: Dict[Tuple[str, int], MetricsRankEngine] = {}
+
+
+def get_rank_engine(
+    db: MonitorDatabase,
+    market_id_hex: str,
+    history_window: int,
+) -> MetricsRankEngine:
+    """
+    首次调用时从 SQLite 预热一次（只加载已提交的历史，本轮指标还没写入）；
+    本轮指标由 commit_rank_sample 在事务提交之后再 push，回滚时引擎保持不变。
+    """
+    key = (market_id_hex, int(history_window))
+    engine = _rank_engines.get(key)
+    if engine is None:
+        engine = MetricsRankEngine(history_window)
+        engine.warm(db.load_recent_metrics(market_id_hex, limit=history_window))
+        _rank_engines[key] = engine
+        print(f"🔥 已从数据库预热分位引擎，样本数 {len(engine)}")
+    return engine
+
+
+def commit_rank_sample(
+    market_id_hex: str,
+    metrics: Dict[str, Any],
+    history_window: Optional[int] = None,
+):
+    """本轮 risk_metrics 已经提交后调用：把本轮指标 push 进常驻的分位引擎。"""
+    if history_window is None:
+        history_window = RISK_CONFIG["history_window"]
+    engine = _rank_engines.get((market_id_hex, int(history_window)))
+    if engine is not None:
+        engine.push(metrics)
+
+
+def evict_rank_engines(market_id_hex: str):
+    """市场从 markets.json 移除后释放它的分位引擎（每个因子一棵 Fenwick 树）。"""
+    for key in [k for k in _rank_engines if k[0] == market_id_hex]:
+        del _rank_engines[key]
+
+
 def compute_risk_level_dynamic(
     db: MonitorDatabase,
     market_id_hex: str,
     metrics: Dict[str, Any],
-    history_window: int = 500,
+    history_window: Optional[int] = None,
 ) -> int:
     """
     动态版：根据最近 history_window 条历史数据，计算当前的分位数打分。
     如果历史不足（比如 <30 条），自动 fallback 到静态逻辑。
+    打分时把本轮指标当作已在窗口内，但不修改引擎，见 commit_rank_sample。
     """
-    history = db.load_recent_metrics(market_id_hex, limit=history_window)
+    if history_window is None:
+        history_window = RISK_CONFIG["history_window"]
+    engine = get_rank_engine(db, market_id_hex, history_window)
+    samples = engine.len_with_pending()
 
-    if len(history) < 30:
+    if samples < RISK_CONFIG["min_history_for_dynamic"]:
         # 历史太少，先用静态逻辑，避免一开始指标抖动太大
-        print(f"ℹ️ 历史样本不足 {len(history)} 条，使用静态打分逻辑。")
+        print(f"ℹ️ 历史样本不足 {samples} 条，使用静态打分逻辑。")
         return compute_risk_level_static(metrics)
 
-    dex_volume_hist = [h["dex_volume"] for h in history]
-    dex_trades_hist = [h["dex_trades"] for h in history]
-    whale_sell_hist = [h["whale_sell_total"] for h in history]
-    cex_inflow_hist = [h["cex_net_inflow"] for h in history]
-
     dex_volume = metrics["dex_volume"]
     dex_trades = metrics["dex_trades"]
     whale_sell_total = metrics["whale_sell_total"]
     cex_net_inflow = metrics["cex_net_inflow"]
 
     # DEX：成交量与笔数各算一个分位，然后平均
-    p_dex_vol = percentile_rank(dex_volume_hist, dex_volume)
-    p_dex_trd = percentile_rank(dex_trades_hist, dex_trades)
+    p_dex_vol = engine.rank_with("dex_volume", dex_volume)
+    p_dex_trd = engine.rank_with("dex_trades", dex_trades)
     p_dex = (p_dex_vol + p_dex_trd) / 2.0
     dex_score = score_from_percentile(p_dex)
 
     # Whale：按卖出总量的分位
-    p_whale = percentile_rank(whale_sell_hist, whale_sell_total)
+    p_whale = engine.rank_with("whale_sell_total", whale_sell_total)
     whale_score = score_from_percentile(p_whale)
 
     # CEX：按净流入分位
-    p_cex = percentile_rank(cex_inflow_hist, cex_net_inflow)
+    p_cex = engine.rank_with("cex_net_inflow", cex_net_inflow)
     cex_score = score_from_percentile(p_cex)
 
     score = dex_score + whale_score + cex_score
@@ -308,14 +429,260 @@ def compute_risk_level_dynamic(
 
 
 # ----------------------------------------------------------------------
-# 5. 主监控循环（加入动态打分）
+# 5. 多市场调度：一个进程监控 N 个池子
 # ----------------------------------------------------------------------
 
+def get_dex_markets(
+    markets: List[Dict[str, Any]],
+    labels: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """返回所有 type == 'dex_pool' 的市场；labels 非空时只保留其中列出的。"""
+    dex_markets = [
+        m for m in markets
+        if m.get("type") == "dex_pool" and (m.get("pairAddress") or m.get("address"))
+    ]
+    if labels:
+        wanted = set(labels)
+        dex_markets = [m for m in dex_markets if m.get("label") in wanted]
+    if not dex_markets:
+        raise RuntimeError("markets.json 中没有 type == 'dex_pool' 的市场配置，请先配置一个 DEX 池子。")
+    return dex_markets
+
+
+def sync_market_states(
+    states: List[Dict[str, Any]],
+    markets: List[Dict[str, Any]],
+    labels: Optional[List[str]],
+    poll_interval: int,
+    blocks_back: int,
+) -> List[Dict[str, Any]]:
+    """
+    markets 热加载后对齐池子状态：新增的池子建新状态，删掉的池子移除，
+    仍在的池子保留防抖计数 / 链上等级等运行状态。
+    """
+    existing = {st["label"]: st for st in states}
+    synced = []
+    for m in get_dex_markets(markets, labels):
+        st = existing.get(m["label"])
+        if st is None:
+            st = init_market_state(m, poll_interval, blocks_back)
+            print(f"➕ 新增监控市场: {st['label']} ({st['pair_address']})")
+        synced.append(st)
+    for label in existing.keys() - {st["label"] for st in synced}:
+        evict_rank_engines(existing[label]["market_id_hex"])
+        print(f"➖ 移除监控市场: {label}")
+    return synced
+
+
+def init_market_state(
+    dex_market: Dict[str, Any],
+    poll_interval: int,
+    blocks_back: int,
+) -> Dict[str, Any]:
+    """
+    每个池子一份独立状态：轮询节奏、防抖计数、链上等级。
+    markets.json 里的单个市场可以用 poll_interval / blocks_back 覆盖全局配置。
+    """
+    label: str = dex_market["label"]
+    market_id: bytes = calc_market_id(label)
+    return {
+        "label": label,
+        "pair_address": dex_market.get("pairAddress") or dex_market.get("address"),
+        # 池子所在链：抓 Swap / 读 reserves / 估算流动性都走这条链的 RPC
+        "network": dex_market.get("network", "mainnet"),
+        "market_id": market_id,
+        "market_id_hex": market_id.hex(),
+        "poll_interval": int(dex_market.get("poll_interval") or poll_interval),
+        "blocks_back": int(dex_market.get("blocks_back") or blocks_back),
+        "last_level": None,
+        "onchain_level": None,
+        "last_update_ts": None,
+        "stable_rounds": 0,
+        "next_run": 0.0,
+    }
+
+
+def run_market_round(
+    db: MonitorDatabase,
+    w3: Web3,
+    contract,
+    state: Dict[str, Any],
+    whales: FrozenSet[str],
+    cex_addresses: FrozenSet[str],
+    tick_cache: Dict[Any, Any],
+):
+    """
+    跑一个池子的一轮：采集因子 → 入库 → 动态打分 → 防抖后决定是否上链。
+    tick_cache 在同一调度周期内的各池子间共享：巨鲸 / CEX 扫描只做一次，
+    缺少 Sync 储备记录的池子由调度器按链各用一次 Multicall 预先读好 reserves，
+    放在 tick_cache[("reserves", network)]。
+    """
+    pair_address: str = state["pair_address"]
+    market_id_hex: str = state["market_id_hex"]
+    blocks_back: int = state["blocks_back"]
+    network: str = state["network"]
+
+    # 上一轮超时的抓取还在跑时直接等它，不再对同一个池子再发一次 eth_getLogs
+    swap_fetch: Optional[Future] = state.get("swap_fetch")
+    if swap_fetch is None:
+        cursor = db.get_ingest_cursor(pair_address)
+        swap_fetch = _factor_executor.submit(fetch_swap_delta, pair_address, cursor, blocks_back, network)
+        state["swap_fetch"] = swap_fetch
+
+    def _collect_whale_cex() -> Tuple[int, int, int]:
+        if network != "mainnet":
+            # 巨鲸 / 交易所热钱包名单和 Etherscan 客户端都只覆盖主网
+            print(f"ℹ️ {network} 上的池子不统计巨鲸抛压与 CEX 净流入，视为 0。")
+            return 0, 0, 0
+        if not cex_addresses:
+            print("ℹ️ 没有配置交易所热钱包地址，巨鲸抛压与 CEX 净流入视为 0。")
+            return 0, 0, 0
+        if not whales:
+            print("ℹ️ 没有配置巨鲸地址，巨鲸抛压视为 0。")
+
+        key = ("whale_cex", blocks_back)
+        if key in tick_cache:
+            return tick_cache[key]
+        # 每个 CEX 地址只扫一次，同时算巨鲸卖压和净流入
+        result = fetch_whale_cex_metrics(
+            whales=whales,
+            cex_addresses=cex_addresses,
+            blocks_back=blocks_back,
+            network=network,
+        )
+        tick_cache[key] = result
+        return result
+
+    collectors: Dict[str, Tuple[Any, Any]] = {
+        "swaps": (swap_fetch, None),
+        "whale_cex": (_collect_whale_cex, (0, 0, 0)),
+    }
+    # 库里没有 Sync 储备、调度器本周期的 Multicall 也没读到时，才作为单独的因子去链上估算
+    prefetched = tick_cache.get(("reserves", network), {}).get(pair_address.lower())
+    if prefetched is None and db.load_reserves_at(pair_address) is None:
+        collectors["liquidity"] = (lambda: estimate_pool_liquidity(pair_address, network=network), 0)
+
+    # 工作线程只抓数据；等所有 future 有了结果（或超时）之后才开事务
+    factors, _ = collect_factors(collectors, RISK_CONFIG["factor_timeouts"])
+    if swap_fetch.done():
+        state["swap_fetch"] = None
+
+    # 整轮写库（trades + 游标 + reserves + metrics + risk_level）都在当前线程、同一个事务里提交；
+    # 抓取超时 / 失败时不推进游标，用库里已有的数据算窗口
+    with db.unit_of_work():
+        delta = factors["swaps"]
+        if delta is not None:
+            window_start = store_swap_delta(db, pair_address, delta)
+            dex_volume, dex_trades = db.load_trade_window(pair_address, window_start)
+        else:
+            cursor = db.get_ingest_cursor(pair_address)
+            if cursor is None:
+                dex_volume, dex_trades = 0, 0
+            else:
+                dex_volume, dex_trades = db.load_trade_window(pair_address, max(0, cursor - blocks_back))
+
+        # 最近一个 Sync 就是当前储备；其次用调度器 Multicall 读到的，最后才用链上估算的因子
+        r = db.load_reserves_at(pair_address)
+        if r is None:
+            r = prefetched
+        pool_liquidity = liquidity_from_reserves(r) if r is not None else factors.get("liquidity", 0)
+        whale_sell_total, whale_count_selling, cex_net_inflow = factors["whale_cex"]
+
+        metrics = {
+            "dex_volume": dex_volume,
+            "dex_trades": dex_trades,
+            "whale_sell_total": whale_sell_total,
+            "whale_count_selling": whale_count_selling,
+            "cex_net_inflow": cex_net_inflow,
+            "pool_liquidity": pool_liquidity,
+        }
+
+        print(
+            f"DEX 交易笔数: {dex_trades}, "
+            f"volume(原始单位): {dex_volume}, "
+            f"pool_liquidity(估计): {pool_liquidity}"
+        )
+        print(
+            f"巨鲸卖出总量: {whale_sell_total}, "
+            f"卖出巨鲸数: {whale_count_selling}, "
+            f"CEX 净流入: {cex_net_inflow}"
+        )
+
+        # ✅ 使用动态分位打分逻辑（内部会在历史太少时自动 fallback）；
+        # 分位引擎在预热时只加载已提交的历史，所以要在写入本轮指标之前调用
+        level = compute_risk_level_dynamic(db, market_id_hex, metrics)
+        print(f"当前计算风险等级(动态): {level}")
+
+        # ✅ 本轮指标存进 risk_metrics 表
+        db.save_metrics(market_id_hex, metrics)
+
+        # 原来的 risk_levels 表照样记录
+        db.save_risk_level(
+            market_id=market_id_hex,
+            level=level,
+            source="multi_factor_dynamic",
+        )
+
+    print(f"💾 已提交本轮数据到本地数据库 {os.path.basename(db.db_path)}")
+    # 只有提交成功才更新内存里的分位引擎，事务回滚时引擎和库保持一致
+    commit_rank_sample(market_id_hex, metrics)
+
+    # ===== 防抖逻辑：判断是否需要上链 =====
+    if state["last_level"] is None:
+        state["stable_rounds"] = 1
+    elif level == state["last_level"]:
+        state["stable_rounds"] += 1
+    else:
+        state["stable_rounds"] = 1
+
+    state["last_level"] = level
+
+    stable_rounds = state["stable_rounds"]
+    onchain_level = state["onchain_level"]
+    last_update_ts = state["last_update_ts"]
+
+    now_ts = time.time()
+    min_interval = RISK_CONFIG["min_update_interval_sec"]
+    min_rounds = RISK_CONFIG["min_stable_rounds_for_update"]
+
+    if onchain_level is None:
+        should_update = True
+        reason = "首次初始化 onchain_level"
+    else:
+        enough_rounds = stable_rounds >= min_rounds
+        enough_time = (
+            last_update_ts is None
+            or (now_ts - last_update_ts) >= min_interval
+        )
+        should_update = (level != onchain_level) and enough_rounds and enough_time
+        reason = (
+            f"等级变化且已稳定 {stable_rounds} 轮且距离上次更新 "
+            f"{0 if last_update_ts is None else int(now_ts - last_update_ts)} 秒"
+        )
+
+    if should_update:
+        print(f"⚠️ 符合上链条件（{reason}），调用合约更新...")
+        tx_hash = send_update_risk_tx(w3, contract, level, market_id=state["market_id"])
+        print(f"✅ 已提交交易，tx = {tx_hash}")
+        state["onchain_level"] = level
+        state["last_update_ts"] = now_ts
+    else:
+        print(
+            f"风险等级暂不更新到链上（onchain_level={onchain_level}, "
+            f"stable_rounds={stable_rounds}, reason={reason})"
+        )
+
+
 def monitor_loop(
     network: str = "sepolia",
     poll_interval: Optional[int] = None,
     blocks_back: Optional[int] = None,
+    labels: Optional[List[str]] = None,
 ):
+    """
+    多市场调度器：所有池子共用一个进程里的 RPC 连接池、区块头缓存和 Etherscan 客户端，
+    每个池子按自己的 poll_interval 到期后跑一轮。
+    """
     if poll_interval is None:
         poll_interval = RISK_CONFIG["poll_interval"]
     if blocks_back is None:
@@ -324,175 +691,65 @@ def monitor_loop(
     db = MonitorDatabase()
     w3, contract = load_risk_monitor_contract(network)
 
-    markets = load_markets()
-    dex_market = get_default_dex_market(markets)
-
-    pair_address: str = dex_market.get("pairAddress") or dex_market.get("address")
-    label: str = dex_market["label"]
-    market_id: bytes = calc_market_id(label)
-    market_id_hex = market_id.hex()
-
-    whales: List[str] = []
-    cex_addresses: List[str] = []
-
-    for m in markets:
-        if m.get("network", "mainnet") != "mainnet":
-            continue
-
-        addr = m.get("address")
-        if not is_valid_eth_address(addr or ""):
-            continue
-
-        t = m.get("type")
-
-        if t in ("whale_eth", "whale"):
-            whales.append(addr)
-        if t in ("exchange_eth", "exchange"):
-            cex_addresses.append(addr)
+    # markets.json / auto_whales.json / auto_cex.json 变化时热加载，地址集合在加载时构建一次
+    watcher = MarketsWatcher()
+    states = [
+        init_market_state(m, poll_interval, blocks_back)
+        for m in get_dex_markets(watcher.markets, labels)
+    ]
+    whales, cex_addresses = watcher.whales, watcher.cex_addresses
 
     print("🚀 启动监控：")
-    print(f"  监控市场 label      : {label}")
-    print(f"  DEX 池子地址        : {pair_address}")
-    print(f"  marketId(bytes32)   : {market_id_hex}")
+    for st in states:
+        print(f"  监控市场 label      : {st['label']}")
+        print(f"    DEX 池子地址      : {st['pair_address']} ({st['network']})")
+        print(f"    marketId(bytes32) : {st['market_id_hex']}")
+        print(f"    轮询间隔          : {st['poll_interval']}s")
     print(f"  巨鲸地址数          : {len(whales)}")
     print(f"  交易所热钱包地址数  : {len(cex_addresses)}")
 
-    last_level: Optional[int] = None
-    onchain_level: Optional[int] = None
-    last_update_ts: Optional[float] = None
-    stable_rounds: int = 0
-
     while True:
-        print("\n=== 开始新一轮监控 ===")
-        loop_start = time.time()
-
         try:
-            trades = fetch_recent_swaps(
-                pair_address=pair_address,
-                blocks_back=blocks_back,
-                network="mainnet",
-            )
-            db.save_trades(trades)
-
-            dex_volume = sum(int(t["amount_in"]) for t in trades)
-            dex_trades = len(trades)
+            if watcher.poll():
+                states = sync_market_states(states, watcher.markets, labels, poll_interval, blocks_back)
+                whales, cex_addresses = watcher.whales, watcher.cex_addresses
+                print(
+                    f"🔄 markets 配置已重新加载：巨鲸地址 {len(whales)} 个，"
+                    f"交易所热钱包 {len(cex_addresses)} 个，监控市场 {len(states)} 个"
+                )
+        except Exception as e:
+            print(f"⚠️ 重新加载 markets 配置失败，继续使用旧配置: {e}")
 
-            pool_liquidity = estimate_pool_liquidity(pair_address, network="mainnet")
+        tick_cache: Dict[Any, Any] = {}
+        due = [st for st in states if st["next_run"] <= time.time()]
 
+        # 只有还没有 Sync 储备记录的池子才需要去链上读 getReserves；每条链一次 Multicall
+        need_reserves: Dict[str, List[str]] = {}
+        for st in due:
+            if db.load_reserves_at(st["pair_address"]) is None:
+                need_reserves.setdefault(st["network"], []).append(st["pair_address"])
+        for net, pairs in need_reserves.items():
             try:
-                if whales:
-                    whale_sell_total, whale_count_selling = fetch_whale_metrics(
-                        whales=whales,
-                        cex_addresses=cex_addresses,
-                        pair_address=pair_address,
-                        blocks_back=blocks_back,
-                        network="mainnet",
-                    )
-                else:
-                    whale_sell_total, whale_count_selling = 0, 0
-                    print("ℹ️ 没有配置巨鲸地址，跳过巨鲸抛压统计。")
+                tick_cache[("reserves", net)] = fetch_pool_reserves(pairs, network=net)
             except Exception as e:
-                print(f"⚠️ 巨鲸统计失败，本轮按 0 处理: {e}")
-                whale_sell_total, whale_count_selling = 0, 0
+                print(f"⚠️ [{net}] Multicall 批量读取 reserves 失败，各池子单独读取: {e}")
 
+        for st in due:
+            print(f"\n=== [{st['label']}] 开始新一轮监控 ===")
+            round_start = time.time()
             try:
-                if cex_addresses:
-                    cex_net_inflow = fetch_cex_net_inflow(
-                        cex_addresses=cex_addresses,
-                        blocks_back=blocks_back,
-                        network="mainnet",
-                    )
-                else:
-                    cex_net_inflow = 0
-                    print("ℹ️ 没有配置交易所热钱包地址，CEX 净流入视为 0。")
+                run_market_round(db, w3, contract, st, whales, cex_addresses, tick_cache)
             except Exception as e:
-                print(f"⚠️ CEX 净流入统计失败，本轮按 0 处理: {e}")
-                cex_net_inflow = 0
-
-            metrics = {
-                "dex_volume": dex_volume,
-                "dex_trades": dex_trades,
-                "whale_sell_total": whale_sell_total,
-                "whale_count_selling": whale_count_selling,
-                "cex_net_inflow": cex_net_inflow,
-                "pool_liquidity": pool_liquidity,
-            }
-
-            print(
-                f"DEX 交易笔数: {dex_trades}, "
-                f"volume(原始单位): {dex_volume}, "
-                f"pool_liquidity(估计): {pool_liquidity}"
-            )
-            print(
-                f"巨鲸卖出总量: {whale_sell_total}, "
-                f"卖出巨鲸数: {whale_count_selling}, "
-                f"CEX 净流入: {cex_net_inflow}"
-            )
-
-            # ✅ 先把本轮指标存进 risk_metrics 表
-            db.save_metrics(market_id_hex, metrics)
-
-            # ✅ 使用动态分位打分逻辑（内部会在历史太少时自动 fallback）
-            level = compute_risk_level_dynamic(db, market_id_hex, metrics)
-            print(f"当前计算风险等级(动态): {level}")
-
-            # 原来的 risk_levels 表照样记录
-            db.save_risk_level(
-                market_id=market_id_hex,
-                level=level,
-                source="multi_factor_dynamic",
-            )
-            print(f"💾 已写入本地数据库 {os.path.basename(db.db_path)}")
-
-            # ===== 防抖逻辑：判断是否需要上链 =====
-            if last_level is None:
-                stable_rounds = 1
-            elif level == last_level:
-                stable_rounds += 1
-            else:
-                stable_rounds = 1
-
-            last_level = level
-
-            now_ts = time.time()
-            min_interval = RISK_CONFIG["min_update_interval_sec"]
-            min_rounds = RISK_CONFIG["min_stable_rounds_for_update"]
-
-            if onchain_level is None:
-                should_update = True
-                reason = "首次初始化 onchain_level"
-            else:
-                enough_rounds = stable_rounds >= min_rounds
-                enough_time = (
-                    last_update_ts is None
-                    or (now_ts - last_update_ts) >= min_interval
-                )
-                should_update = (level != onchain_level) and enough_rounds and enough_time
-                reason = (
-                    f"等级变化且已稳定 {stable_rounds} 轮且距离上次更新 "
-                    f"{0 if last_update_ts is None else int(now_ts - last_update_ts)} 秒"
-                )
-
-            if should_update:
-                print(f"⚠️ 符合上链条件（{reason}），调用合约更新...")
-                tx_hash = send_update_risk_tx(w3, contract, level, market_id=market_id)
-                print(f"✅ 已提交交易，tx = {tx_hash}")
-                onchain_level = level
-                last_update_ts = now_ts
-            else:
-                print(
-                    f"风险等级暂不更新到链上（onchain_level={onchain_level}, "
-                    f"stable_rounds={stable_rounds}, reason={reason})"
-                )
-
-        except Exception as e:
-            print(f"❌ 本轮监控出现异常，跳过本轮：{e}")
+                print(f"❌ [{st['label']}] 本轮监控出现异常，跳过本轮：{e}")
+            st["next_run"] = round_start + st["poll_interval"]
 
-        elapsed = time.time() - loop_start
-        sleep_sec = max(1, poll_interval - elapsed)
+        next_run = min(st["next_run"] for st in states)
+        sleep_sec = max(1, next_run - time.time())
         print(f"⏳ 等待 {int(sleep_sec)} 秒后进行下一轮...")
         time.sleep(sleep_sec)
 
 
 if __name__ == "__main__":
-    monitor_loop()
\ No newline at end of file
+    # MONITOR_MARKETS=LABEL_A,LABEL_B 只监控指定池子；不配置则监控全部 dex_pool
+    monitor_labels = [x.strip() for x in os.getenv("MONITOR_MARKETS", "").split(",") if x.strip()]
+    monitor_loop(labels=monitor_labels or None)
@@ -0,0 +1,167 @@
+# backend/multicall.py
+"""
+基于 Multicall3 的批量只读调用：
+  - aggregate3：一次 eth_call 打包任意多个 (target, calldata)
+  - fetch_pool_reserves：一次性读取多个 Uniswap V2 池子的 reserves，
+    token0 / token1 / decimals 元数据只在第一次读取后永久缓存，
+    reserves 按 (区块, 池子) 缓存，同一区块内重复读取不再发 RPC。
+
+Multicall3 在主网 / Sepolia 等链上部署在同一个地址；本地 Hardhat / anvil 开发链
+可以自己部署一个，然后用 MULTICALL3_ADDRESS 覆盖。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import List, Dict, Any, Tuple, Optional, Iterable
+
+from web3 import Web3
+
+from config import make_web3
+from lru import LRU
+
+MULTICALL3_ADDRESS = os.getenv("MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11")
+
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]",
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]",
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function",
+    }
+]
+
+SEL_GET_RESERVES = bytes(Web3.keccak(text="getReserves()")[:4])
+SEL_TOKEN0 = bytes(Web3.keccak(text="token0()")[:4])
+SEL_TOKEN1 = bytes(Web3.keccak(text="token1()")[:4])
+SEL_DECIMALS = bytes(Web3.keccak(text="decimals()")[:4])
+
+# (network, pair) -> {"token0", "token1", "decimals0", "decimals1"}，池子元数据不会变
+_pair_meta_cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+# (network, block_number, pair) -> {"reserve0", "reserve1", "block_timestamp_last"}
+_reserves_cache: LRU = LRU(maxsize=1024)
+_cache_lock = threading.Lock()
+
+
+def aggregate3(
+    w3: Web3,
+    calls: List[Tuple[str, bytes]],
+    block_identifier: Any = "latest",
+) -> List[Tuple[bool, bytes]]:
+    """calls: [(target, calldata), ...]，允许单个调用失败，返回 [(success, returnData), ...]。"""
+    if not calls:
+        return []
+
+    mc = w3.eth.contract(address=Web3.to_checksum_address(MULTICALL3_ADDRESS), abi=MULTICALL3_ABI)
+    results = mc.functions.aggregate3(
+        [(Web3.to_checksum_address(target), True, data) for target, data in calls]
+    ).call(block_identifier=block_identifier)
+    return [(bool(ok), bytes(data)) for ok, data in results]
+
+
+def _load_pair_meta(w3: Web3, network: str, pairs: List[str], block_number: int):
+    """补齐缺失的池子元数据：先一次拿 token0/token1，再一次拿两边 decimals。"""
+    calls: List[Tuple[str, bytes]] = []
+    for pair in pairs:
+        calls.append((pair, SEL_TOKEN0))
+        calls.append((pair, SEL_TOKEN1))
+    results = aggregate3(w3, calls, block_identifier=block_number)
+
+    tokens: Dict[str, Tuple[str, str]] = {}
+    for i, pair in enumerate(pairs):
+        (ok0, data0), (ok1, data1) = results[2 * i], results[2 * i + 1]
+        if not (ok0 and ok1):
+            print(f"⚠️ 读取池子 token0/token1 失败，已跳过: {pair}")
+            continue
+        token0 = w3.codec.decode(["address"], data0)[0]
+        token1 = w3.codec.decode(["address"], data1)[0]
+        tokens[pair] = (token0, token1)
+
+    unique_tokens = sorted({t for pair_tokens in tokens.values() for t in pair_tokens})
+    dec_results = aggregate3(w3, [(t, SEL_DECIMALS) for t in unique_tokens], block_identifier=block_number)
+    decimals: Dict[str, Optional[int]] = {}
+    for token, (ok, data) in zip(unique_tokens, dec_results):
+        decimals[token] = int(w3.codec.decode(["uint8"], data)[0]) if ok and data else None
+
+    with _cache_lock:
+        for pair, (token0, token1) in tokens.items():
+            _pair_meta_cache[(network, pair)] = {
+                "token0": token0,
+                "token1": token1,
+                "decimals0": decimals.get(token0),
+                "decimals1": decimals.get(token1),
+            }
+
+
+def fetch_pool_reserves(
+    pairs: Iterable[str],
+    network: str = "mainnet",
+    block_number: Optional[int] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    批量读取 Uniswap V2 池子的 reserves + 元数据，返回 {pair(小写): {...}}。
+    同一区块内已经读过的池子直接走缓存；读取失败的池子不会出现在结果里。
+    """
+    w3 = make_web3(network)
+    if block_number is None:
+        block_number = w3.eth.block_number
+
+    pair_list = sorted({Web3.to_checksum_address(p) for p in pairs})
+
+    with _cache_lock:
+        need_meta = [p for p in pair_list if (network, p) not in _pair_meta_cache]
+        need_reserves = [p for p in pair_list if (network, block_number, p) not in _reserves_cache]
+
+    if need_meta:
+        _load_pair_meta(w3, network, need_meta, block_number)
+
+    if need_reserves:
+        results = aggregate3(
+            w3,
+            [(p, SEL_GET_RESERVES) for p in need_reserves],
+            block_identifier=block_number,
+        )
+        with _cache_lock:
+            for pair, (ok, data) in zip(need_reserves, results):
+                if not ok:
+                    print(f"⚠️ getReserves 调用失败，已跳过: {pair}")
+                    continue
+                reserve0, reserve1, ts_last = w3.codec.decode(["uint112", "uint112", "uint32"], data)
+                _reserves_cache[(network, block_number, pair)] = {
+                    "reserve0": int(reserve0),
+                    "reserve1": int(reserve1),
+                    "block_timestamp_last": int(ts_last),
+                }
+
+    out: Dict[str, Dict[str, Any]] = {}
+    with _cache_lock:
+        for pair in pair_list:
+            reserves = _reserves_cache.get((network, block_number, pair))
+            meta = _pair_meta_cache.get((network, pair))
+            if reserves is None:
+                continue
+            out[pair.lower()] = {**(meta or {}), **reserves, "block_number": block_number}
+    return out
@@ -0,0 +1,191 @@
+# backend/onchain_cache.py
+"""
+链上 RiskMonitor.markets[marketId] 的服务端缓存，给 /api/onchain_risk 用。
+
+- 命中缓存时不发 RPC；浏览器再多，RPC 次数也只跟区块 / 事件数量有关
+- 后台线程按区块推进扫描 RiskUpdated / MarketRegistered 事件：
+    RiskUpdated      -> 直接用事件里的 level / timestamp 原地更新缓存
+    MarketRegistered -> 让该市场的缓存失效，下次读取时重新 call
+  扫描失败或落后太多时整体失效，退回到按需读取
+- 同一个 marketId 的并发未命中只发一次 markets(...) 调用，其它请求等待结果
+- 有等级变化时通知订阅者（SSE 推送用）
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from web3 import Web3
+
+RISK_UPDATED_TOPIC0 = Web3.keccak(text="RiskUpdated(bytes32,uint8,uint256)")
+MARKET_REGISTERED_TOPIC0 = Web3.keccak(text="MarketRegistered(bytes32)")
+
+# 单次 eth_getLogs 最多向前追多少个区块，落后更多时直接整体失效
+MAX_LOG_SCAN_BLOCKS = 2000
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class OnchainRiskCache:
+    def __init__(
+        self,
+        w3: Web3,
+        contract,
+        poll_interval: float = 4.0,
+        max_age: float = 600.0,
+    ):
+        self.w3 = w3
+        self.contract = contract
+        self.poll_interval = poll_interval
+        # 兜底：即使漏了事件，缓存最多用这么久
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        # marketId(bytes32) -> {"level", "last_update", "exists", "fetched_at"}
+        self._entries: Dict[bytes, Dict[str, Any]] = {}
+        self._inflight: Dict[bytes, _InFlight] = {}
+        self._listeners: List[Callable[[bytes, Dict[str, Any]], None]] = []
+
+        self._last_block: Optional[int] = None
+        self._watcher: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # 读取：缓存 + 并发未命中合并
+    # ------------------------------------------------------------------
+    def get(self, market_id: bytes) -> Dict[str, Any]:
+        self._ensure_watcher()
+        market_id = bytes(market_id)
+
+        with self._lock:
+            entry = self._entries.get(market_id)
+            if entry is not None and time.time() - entry["fetched_at"] < self.max_age:
+                return entry
+
+            flight = self._inflight.get(market_id)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[market_id] = _InFlight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        started = time.time()
+        try:
+            # struct MarketRisk { uint8 level; uint256 lastUpdate; bool exists; }
+            m = self.contract.functions.markets(market_id).call()
+            entry = {
+                "level": int(m[0]),
+                "last_update": int(m[1]),
+                "exists": bool(m[2]),
+                "fetched_at": time.time(),
+            }
+            with self._lock:
+                newer = self._entries.get(market_id)
+                # 调用期间事件扫描已经写入了更新的状态，以事件为准
+                if newer is not None and newer["fetched_at"] > started:
+                    entry = newer
+                else:
+                    self._entries[market_id] = entry
+            flight.result = entry
+            return entry
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(market_id, None)
+            flight.done.set()
+
+    def add_listener(self, callback: Callable[[bytes, Dict[str, Any]], None]):
+        """callback(market_id, entry)：链上等级发生变化时调用（在后台线程里）。"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    # ------------------------------------------------------------------
+    # 后台事件扫描
+    # ------------------------------------------------------------------
+    def _ensure_watcher(self):
+        if self._watcher is not None:
+            return
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch_loop, name="onchain-risk-watcher", daemon=True)
+            self._watcher.start()
+
+    def _invalidate_all(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _watch_loop(self):
+        while True:
+            try:
+                self._poll_once()
+            except Exception as e:
+                print(f"⚠️ 扫描 RiskUpdated 事件失败，缓存整体失效: {e}")
+                self._invalidate_all()
+                self._last_block = None
+            time.sleep(self.poll_interval)
+
+    def _poll_once(self):
+        latest = self.w3.eth.block_number
+        if self._last_block is None:
+            # 刚启动（或扫描失败后已整体失效）：缓存里只有刚读到的最新状态，
+            # 直接从当前区块开始跟踪，不再让它们失效、重复发一轮 markets(...) 调用
+            self._last_block = latest
+            return
+        if latest - self._last_block > MAX_LOG_SCAN_BLOCKS:
+            # 落后太多：中间的事件追不回来，之前的缓存不可信，从当前区块重新开始跟踪
+            self._invalidate_all()
+            self._last_block = latest
+            return
+        if latest <= self._last_block:
+            return
+
+        logs = self.w3.eth.get_logs(
+            {
+                "address": self.contract.address,
+                "fromBlock": self._last_block + 1,
+                "toBlock": latest,
+                "topics": [[RISK_UPDATED_TOPIC0, MARKET_REGISTERED_TOPIC0]],
+            }
+        )
+
+        changed: List[tuple] = []
+        with self._lock:
+            for log in logs:
+                topic0 = bytes(log["topics"][0])
+                market_id = bytes(log["topics"][1])
+                if topic0 == bytes(MARKET_REGISTERED_TOPIC0):
+                    self._entries.pop(market_id, None)
+                    continue
+
+                data = bytes(log["data"])
+                entry = {
+                    "level": int.from_bytes(data[0:32], "big"),
+                    "last_update": int.from_bytes(data[32:64], "big"),
+                    "exists": True,
+                    "fetched_at": time.time(),
+                }
+                self._entries[market_id] = entry
+                changed.append((market_id, entry))
+            listeners = list(self._listeners)
+
+        self._last_block = latest
+
+        for market_id, entry in changed:
+            for cb in listeners:
+                try:
+                    cb(market_id, entry)
+                except Exception as e:
+                    print(f"⚠️ 链上等级变化回调失败: {e}")
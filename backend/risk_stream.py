@@ -0,0 +1,238 @@
+# backend/risk_stream.py
+"""
+SSE 推送：把监控进程新写入的 risk_levels / risk_metrics 行、以及链上等级变化推给浏览器。
+
+- 监控进程和 API 是两个进程，这里用一个共享的后台线程按自增 id 游标轮询新行
+  （WHERE id > ? 走主键，空轮询几乎没有开销），再扇出到每个订阅者的队列
+- 没有订阅者时不轮询；每个浏览器连接只占一个队列，不再各自每分钟拉 200 行
+- 链上等级变化由 OnchainRiskCache 的监听回调直接 publish
+- 订阅者队列满（客户端太慢）时直接断开，浏览器 EventSource 会带 Last-Event-ID 重连补齐
+- 订阅时可以指定 market_id，只收这个市场的 risk / metrics / onchain 事件（多市场时图表不串线）
+"""
+
+from __future__ import annotations
+
+import json
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from db import ReadOnlyDatabase
+
+# 单次轮询最多取多少行，积压更多时下一轮继续
+STREAM_BATCH_SIZE = 500
+# 断线重连时最多补发多少条 risk 事件
+STREAM_REPLAY_LIMIT = 500
+
+SQL_LEVELS_MAX_ID = "SELECT COALESCE(MAX(id), 0) FROM risk_levels"
+SQL_METRICS_MAX_ID = "SELECT COALESCE(MAX(id), 0) FROM risk_metrics"
+SQL_LEVELS_SINCE = """
+    SELECT id, created_at, market_id, level, source
+    FROM risk_levels
+    WHERE id > ?
+    ORDER BY id LIMIT ?
+"""
+SQL_LEVELS_SINCE_BY_MARKET = """
+    SELECT id, created_at, market_id, level, source
+    FROM risk_levels
+    WHERE market_id = ? AND id > ?
+    ORDER BY id LIMIT ?
+"""
+SQL_METRICS_SINCE = """
+    SELECT
+        id,
+        created_at,
+        market_id,
+        dex_volume,
+        dex_trades,
+        whale_sell_total,
+        whale_count_selling,
+        cex_net_inflow,
+        pool_liquidity
+    FROM risk_metrics
+    WHERE id > ?
+    ORDER BY id LIMIT ?
+"""
+
+
+def normalize_market_id(market_id: Optional[str]) -> Optional[str]:
+    """库里的 market_id 是不带 0x 的小写 hex；链上事件 / 前端传来的可能带 0x。"""
+    if not market_id:
+        return None
+    market_id = market_id.strip().lower()
+    return market_id[2:] if market_id.startswith("0x") else market_id
+
+
+def level_row_to_item(row: tuple) -> Dict[str, Any]:
+    return {
+        "id": row[0],
+        "created_at": row[1],
+        "market_id": row[2],
+        "level": row[3],
+        "source": row[4],
+    }
+
+
+def metrics_row_to_item(row: tuple) -> Dict[str, Any]:
+    # 大整数保持字符串，避免 JS Number 丢精度
+    return {
+        "id": row[0],
+        "created_at": row[1],
+        "market_id": row[2],
+        "dex_volume": row[3],
+        "dex_trades": int(row[4] or 0),
+        "whale_sell_total": row[5],
+        "whale_count_selling": int(row[6] or 0),
+        "cex_net_inflow": row[7],
+        "pool_liquidity": row[8],
+    }
+
+
+def format_sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+class _Subscriber:
+    def __init__(self, max_queue: int, market_id: Optional[str] = None):
+        self.queue: "queue.Queue[str]" = queue.Queue(maxsize=max_queue)
+        self.closed = False
+        # None 表示所有市场
+        self.market_id = market_id
+
+
+class RiskStreamHub:
+    def __init__(
+        self,
+        read_db: ReadOnlyDatabase,
+        poll_interval: float = 1.0,
+        heartbeat: float = 15.0,
+        max_queue: int = 256,
+    ):
+        self.read_db = read_db
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.max_queue = max_queue
+
+        self._lock = threading.Lock()
+        self._subscribers: List[_Subscriber] = []
+        self._wakeup = threading.Event()
+
+        # 已推送到的最大 id；None 表示还没初始化（从当前 MAX(id) 开始，不推历史）
+        self._levels_cursor: Optional[int] = None
+        self._metrics_cursor: Optional[int] = None
+        self._poller: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # 订阅 / 发布
+    # ------------------------------------------------------------------
+    def publish(self, event: str, data: Any, event_id: Optional[int] = None, market_id: Optional[str] = None):
+        """market_id 非空时只推给没有过滤、或者订阅了这个市场的连接。"""
+        message = format_sse(event, data, event_id)
+        market_id = normalize_market_id(market_id)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            if market_id is not None and sub.market_id is not None and sub.market_id != market_id:
+                continue
+            try:
+                sub.queue.put_nowait(message)
+            except queue.Full:
+                self._drop(sub)
+
+    def _subscribe(self, market_id: Optional[str] = None) -> _Subscriber:
+        sub = _Subscriber(self.max_queue, normalize_market_id(market_id))
+        with self._lock:
+            self._subscribers.append(sub)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name="risk-stream-poller", daemon=True)
+                self._poller.start()
+        self._wakeup.set()
+        return sub
+
+    def _drop(self, sub: _Subscriber):
+        sub.closed = True
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(
+        self,
+        last_event_id: Optional[int] = None,
+        initial: Optional[List[str]] = None,
+        market_id: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        单个 SSE 连接的生成器：先订阅再补发，保证补发与实时推送之间没有空档；
+        补发过的 id 由客户端按 id 去重。market_id 非空时实时推送和补发都只含这个市场。
+        """
+        sub = self._subscribe(market_id)
+        try:
+            yield "retry: 5000\n\n"
+            for message in initial or []:
+                yield message
+
+            if last_event_id is not None and self.read_db.exists():
+                if sub.market_id is not None:
+                    rows = self.read_db.query(
+                        SQL_LEVELS_SINCE_BY_MARKET, (sub.market_id, int(last_event_id), STREAM_REPLAY_LIMIT)
+                    )
+                else:
+                    rows = self.read_db.query(SQL_LEVELS_SINCE, (int(last_event_id), STREAM_REPLAY_LIMIT))
+                for row in rows:
+                    yield format_sse("risk", level_row_to_item(row), row[0])
+
+            while not sub.closed:
+                try:
+                    yield sub.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    # 注释行做心跳，防止代理断开空闲连接
+                    yield ": ping\n\n"
+        finally:
+            self._drop(sub)
+
+    # ------------------------------------------------------------------
+    # 后台轮询：按 id 游标取新行
+    # ------------------------------------------------------------------
+    def _poll_loop(self):
+        while True:
+            if self.subscriber_count() == 0:
+                # 没人订阅时不查库；下次有订阅者时从当时的 MAX(id) 重新开始
+                self._levels_cursor = None
+                self._metrics_cursor = None
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            try:
+                self._poll_once()
+            except Exception as e:
+                print(f"⚠️ SSE 轮询新数据失败: {e}")
+                self.read_db.reset()
+            time.sleep(self.poll_interval)
+
+    def _poll_once(self):
+        if not self.read_db.exists():
+            return
+
+        if self._levels_cursor is None or self._metrics_cursor is None:
+            self._levels_cursor = int(self.read_db.query_one(SQL_LEVELS_MAX_ID)[0])
+            self._metrics_cursor = int(self.read_db.query_one(SQL_METRICS_MAX_ID)[0])
+            return
+
+        for row in self.read_db.query(SQL_METRICS_SINCE, (self._metrics_cursor, STREAM_BATCH_SIZE)):
+            self._metrics_cursor = row[0]
+            self.publish("metrics", metrics_row_to_item(row), market_id=row[2])
+
+        for row in self.read_db.query(SQL_LEVELS_SINCE, (self._levels_cursor, STREAM_BATCH_SIZE)):
+            self._levels_cursor = row[0]
+            # risk 事件带 SSE id，重连时 Last-Event-ID 就是 risk_levels.id
+            self.publish("risk", level_row_to_item(row), row[0], market_id=row[2])
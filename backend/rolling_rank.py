@@ -0,0 +1,129 @@
+# backend/rolling_rank.py
+"""
+滚动窗口百分位引擎：替代每轮 sort 历史数据的 percentile_rank。
+
+每个因子一棵 Fenwick 树（树状数组），下标是量化后的取值：
+  - |v| < 2^QUANT_BITS 时精确（dex_trades 这类小整数不受影响）
+  - 更大的值保留最高 QUANT_BITS 位，相对误差 < 2^-(QUANT_BITS-1)
+  - 支持负数（cex_net_inflow 可能为负），量化保持单调
+插入 / 淘汰 / 查询都是 O(log N)，N 与窗口长度无关，只由量化精度决定。
+"""
+
+from __future__ import annotations
+
+from array import array
+from collections import deque
+from typing import Dict, Any, Iterable
+
+QUANT_BITS = 10
+# 只考虑 uint256 范围，超出的值截断到最大桶
+MAX_VALUE_BITS = 256
+
+_Q_MAX = ((MAX_VALUE_BITS - QUANT_BITS) << (QUANT_BITS - 1)) + (1 << QUANT_BITS) - 1
+_OFFSET = _Q_MAX + 1
+_TREE_SIZE = 2 * _Q_MAX + 1
+
+RANKED_FACTORS = ("dex_volume", "dex_trades", "whale_sell_total", "cex_net_inflow")
+
+
+def _quantize_abs(v: int) -> int:
+    if v < (1 << QUANT_BITS):
+        return v
+    if v.bit_length() > MAX_VALUE_BITS:
+        v = (1 << MAX_VALUE_BITS) - 1
+    shift = v.bit_length() - QUANT_BITS
+    return (shift << (QUANT_BITS - 1)) + (v >> shift)
+
+
+def quantize(value: int) -> int:
+    """把任意整数映射到 [1, _TREE_SIZE] 的单调下标。"""
+    v = int(value)
+    if v >= 0:
+        return _OFFSET + _quantize_abs(v)
+    return _OFFSET - _quantize_abs(-v)
+
+
+class RollingPercentile:
+    """固定窗口长度的百分位统计：最旧的样本在窗口满时自动淘汰。"""
+
+    def __init__(self, window: int):
+        self.window = int(window)
+        self.tree = array("q", bytes(8 * (_TREE_SIZE + 1)))
+        self.samples: deque[int] = deque()
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def _add(self, i: int, delta: int):
+        tree = self.tree
+        while i <= _TREE_SIZE:
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i: int) -> int:
+        tree = self.tree
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def push(self, value: int):
+        if len(self.samples) >= self.window:
+            self._add(self.samples.popleft(), -1)
+        i = quantize(value)
+        self.samples.append(i)
+        self._add(i, 1)
+
+    def rank(self, value: int) -> float:
+        """与 percentile_rank 相同语义：窗口中 <= value 的比例 * 100。"""
+        if not self.samples:
+            return 50.0
+        return self._prefix(quantize(value)) / len(self.samples) * 100.0
+
+    def rank_with(self, value: int) -> float:
+        """
+        假设 value 已经 push 进窗口时的 rank，但不修改窗口：
+        本轮指标还没提交时先用它打分，提交成功后再 push。
+        """
+        i = quantize(value)
+        count = self._prefix(i) + 1
+        n = len(self.samples) + 1
+        if self.samples and len(self.samples) >= self.window:
+            # 满窗口时最旧的样本会被挤掉
+            n -= 1
+            if self.samples[0] <= i:
+                count -= 1
+        return count / n * 100.0
+
+
+class MetricsRankEngine:
+    """一个市场的全部打分因子，各自维护一个滚动窗口。"""
+
+    def __init__(self, window: int):
+        self.window = int(window)
+        self.factors: Dict[str, RollingPercentile] = {
+            name: RollingPercentile(window) for name in RANKED_FACTORS
+        }
+
+    def __len__(self) -> int:
+        return len(self.factors[RANKED_FACTORS[0]])
+
+    def warm(self, history: Iterable[Dict[str, Any]]):
+        """用 load_recent_metrics 返回的历史（最旧 → 最新）预热。"""
+        for row in history:
+            self.push(row)
+
+    def push(self, metrics: Dict[str, Any]):
+        for name, rp in self.factors.items():
+            rp.push(int(metrics.get(name, 0) or 0))
+
+    def rank(self, name: str, value: int) -> float:
+        return self.factors[name].rank(value)
+
+    def rank_with(self, name: str, value: int) -> float:
+        return self.factors[name].rank_with(value)
+
+    def len_with_pending(self) -> int:
+        """再 push 一条之后的样本数。"""
+        return min(len(self) + 1, self.window)
@@ -0,0 +1,48 @@
+# backend/tests/conftest.py
+"""
+backend 下的模块按扁平方式互相 import（from db import ...），测试里把 backend 加进 sys.path。
+"""
+
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+class _RpcHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive，方便检查连接复用
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        req = json.loads(body)
+        self.server.client_ports.add(self.client_address[1])
+        payload = json.dumps({"jsonrpc": "2.0", "id": req["id"], "result": "0x10"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def rpc_server():
+    """本地最小 JSON-RPC 服务：所有方法都返回 0x10，记录客户端用过的 TCP 端口。"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RpcHandler)
+    server.client_ports = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,72 @@
+# backend/tests/test_chain_data.py
+
+import pytest
+from eth_abi import encode
+from hexbytes import HexBytes
+from web3 import Web3
+
+from chain_data import SWAP_TOPIC0, SYNC_TOPIC0, UNISWAP_V2_PAIR_ABI, decode_swap_logs, decode_sync_log
+
+PAIR = Web3.to_checksum_address("0x" + "ab" * 20)
+SENDER = "0x" + "11" * 20
+TO = "0x" + "22" * 20
+
+UINT256_MAX = 2**256 - 1
+UINT112_MAX = 2**112 - 1
+
+pair = Web3().eth.contract(address=PAIR, abi=UNISWAP_V2_PAIR_ABI)
+
+
+def _address_topic(addr: str) -> HexBytes:
+    return HexBytes(bytes(12) + bytes.fromhex(addr[2:]))
+
+
+def _raw_log(topics, data: bytes, log_index: int = 3):
+    return {
+        "address": PAIR,
+        "topics": topics,
+        "data": HexBytes(data),
+        "blockNumber": 19_000_000,
+        "blockHash": HexBytes(b"\x01" * 32),
+        "transactionHash": HexBytes(b"\x02" * 32),
+        "transactionIndex": 7,
+        "logIndex": log_index,
+        "removed": False,
+    }
+
+
+@pytest.mark.parametrize(
+    "amounts",
+    [
+        (0, 0, 0, 0),
+        (UINT256_MAX, 0, 0, UINT256_MAX),
+        (1, UINT112_MAX, UINT112_MAX + 1, UINT256_MAX - 1),
+        (10**18, 0, 0, 3_000 * 10**6),
+    ],
+)
+def test_decode_swap_logs_matches_web3(amounts):
+    log = _raw_log(
+        [HexBytes(SWAP_TOPIC0), _address_topic(SENDER), _address_topic(TO)],
+        encode(["uint256"] * 4, list(amounts)),
+    )
+    expected = pair.events.Swap().process_log(log)
+
+    cols = decode_swap_logs([log])
+    assert cols["amount0_in"] == [expected["args"]["amount0In"]]
+    assert cols["amount1_in"] == [expected["args"]["amount1In"]]
+    assert cols["amount0_out"] == [expected["args"]["amount0Out"]]
+    assert cols["amount1_out"] == [expected["args"]["amount1Out"]]
+    assert cols["block_number"] == [expected["blockNumber"]]
+    assert cols["log_index"] == [expected["logIndex"]]
+    assert cols["tx_hash"] == [expected["transactionHash"].hex()]
+
+    # 有的节点把 data 返回成 0x 字符串
+    assert decode_swap_logs([{**log, "data": HexBytes(log["data"]).hex()}]) == cols
+
+
+@pytest.mark.parametrize("reserves", [(0, 0), (UINT112_MAX, 0), (1, UINT112_MAX), (UINT112_MAX, UINT112_MAX)])
+def test_decode_sync_log_matches_web3(reserves):
+    log = _raw_log([HexBytes(SYNC_TOPIC0)], encode(["uint112", "uint112"], list(reserves)))
+    expected = pair.events.Sync().process_log(log)
+
+    assert decode_sync_log(log) == (expected["args"]["reserve0"], expected["args"]["reserve1"])
@@ -0,0 +1,61 @@
+# backend/tests/test_config.py
+
+import threading
+import time
+from types import SimpleNamespace
+
+import config
+
+
+def test_web3_threads_share_one_connection_pool(rpc_server, monkeypatch):
+    url = f"http://127.0.0.1:{rpc_server.server_address[1]}"
+    monkeypatch.setenv("ETH_RPC_URL", url)
+    monkeypatch.setattr(config, "_web3_clients", {})
+
+    w3 = config.make_web3("mainnet")
+    assert w3.eth.block_number == 16
+
+    # 依次在两个新线程里调用：共享 session 时走同一条 keep-alive 连接
+    results = []
+    for _ in range(2):
+        t = threading.Thread(target=lambda: results.append(w3.eth.block_number))
+        t.start()
+        t.join()
+
+    assert results == [16, 16]
+    assert len(rpc_server.client_ports) == 1
+    assert w3.provider.session is config.get_rpc_session("mainnet")
+
+
+def test_slow_health_probe_does_not_block_other_callers(monkeypatch):
+    probing = threading.Event()
+    release = threading.Event()
+
+    def slow_is_connected():
+        probing.set()
+        release.wait(5)
+        return True
+
+    stale = SimpleNamespace(is_connected=slow_is_connected)
+    fresh = SimpleNamespace(is_connected=lambda: True)
+    monkeypatch.setattr(
+        config,
+        "_web3_clients",
+        {
+            "sepolia": {"w3": stale, "session": None, "rpc": "", "checked_at": 0.0},
+            "mainnet": {"w3": fresh, "session": None, "rpc": "", "checked_at": 0.0},
+        },
+    )
+
+    prober = threading.Thread(target=config.make_web3, args=("sepolia",))
+    prober.start()
+    try:
+        assert probing.wait(5)
+        start = time.time()
+        # 别的网络照常探活；同一网络直接拿到现有客户端，不等慢探活
+        assert config.make_web3("mainnet") is fresh
+        assert config.make_web3("sepolia") is stale
+        assert time.time() - start < 1
+    finally:
+        release.set()
+        prober.join()
@@ -0,0 +1,77 @@
+# backend/tests/test_db.py
+
+import threading
+
+from db import MonitorDatabase, ReadOnlyDatabase
+from trades import TradeBatch
+
+
+def test_read_only_pool_reuses_connections_across_threads(tmp_path):
+    path = tmp_path / "monitor.db"
+    MonitorDatabase(path).save_risk_level(market_id="ab" * 32, level=2, source="test")
+
+    read_db = ReadOnlyDatabase(path, pool_size=2)
+    opened = []
+    real_open = read_db._open
+    read_db._open = lambda: opened.append(1) or real_open()
+
+    # 每个请求一个新线程（Werkzeug threaded=True 的行为）
+    results = []
+    for _ in range(5):
+        t = threading.Thread(target=lambda: results.append(read_db.query_one("SELECT level FROM risk_levels")))
+        t.start()
+        t.join()
+
+    assert results == [(2,)] * 5
+    assert len(opened) == 1
+
+    # 并发借出不超过 pool_size，多出来的请求等待归还
+    barrier = threading.Barrier(4)
+
+    def _concurrent():
+        barrier.wait()
+        results.append(read_db.query_one("SELECT COUNT(*) FROM risk_levels"))
+
+    threads = [threading.Thread(target=_concurrent) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(opened) <= 2
+    assert read_db._opened <= 2
+
+
+def test_read_only_pool_discards_broken_connection(tmp_path):
+    path = tmp_path / "monitor.db"
+    MonitorDatabase(path)
+    read_db = ReadOnlyDatabase(path, pool_size=1)
+
+    try:
+        read_db.query("SELECT * FROM no_such_table")
+    except Exception:
+        pass
+    assert read_db._opened == 0
+    assert read_db.query_one("SELECT COUNT(*) FROM risk_levels") == (0,)
+
+
+def test_risk_level_indexes(tmp_path):
+    db = MonitorDatabase(tmp_path / "monitor.db")
+
+    indexes = {row[1] for row in db.conn.execute("PRAGMA index_list(risk_levels)")}
+    # (market_id, created_at) 给 evaluate_signal 的按市场按时间排序用；单列 created_at 没有查询用到
+    assert "idx_risk_levels_market_id" in indexes
+    assert "idx_risk_levels_market_created" in indexes
+    assert "idx_risk_levels_created" not in indexes
+    assert db.conn.execute("PRAGMA user_version").fetchone()[0] == 4
+
+
+def test_save_trades_without_pair_dedupes(tmp_path):
+    db = MonitorDatabase(tmp_path / "monitor.db")
+    batch = TradeBatch()
+    batch.append(100, 1_700_000_000, "0x" + "aa" * 32, "token0", 10, 20, log_index=3)
+
+    db.save_trades(batch)
+    db.save_trades(batch)
+
+    rows = db.conn.execute("SELECT pair_address, log_index FROM trades").fetchall()
+    assert rows == [("", 3)]
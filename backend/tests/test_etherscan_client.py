@@ -0,0 +1,50 @@
+# backend/tests/test_etherscan_client.py
+
+from etherscan_client import ETHERSCAN_FINALITY_DEPTH, EtherscanClient
+
+ADDRESS = "0x" + "22" * 20
+
+
+def _client_with_chain(monkeypatch, tx_blocks):
+    client = EtherscanClient(api_key="test")
+    requests = []
+
+    def fake_request(params):
+        lo, hi = params["startblock"], params["endblock"]
+        requests.append((lo, hi))
+        result = [{"hash": f"0x{b:x}", "blockNumber": str(b)} for b in tx_blocks if lo <= b <= hi]
+        if not result:
+            return {"status": "0", "result": "No transactions found"}
+        return {"status": "1", "result": result}
+
+    monkeypatch.setattr(client, "_request", fake_request)
+    return client, requests
+
+
+def test_rolling_window_only_fetches_new_tail(monkeypatch):
+    client, requests = _client_with_chain(monkeypatch, range(0, 2000, 10))
+
+    first = client.get_normal_txs(ADDRESS, 100, 1000)
+    assert [int(tx["blockNumber"]) for tx in first] == list(range(100, 1001, 10))
+    assert requests == [(100, 1000)]
+
+    # 窗口向前滚动：已确认部分走缓存，只重拉确认深度以内 + 新增的区块
+    second = client.get_normal_txs(ADDRESS, 150, 1100)
+    assert [int(tx["blockNumber"]) for tx in second] == list(range(150, 1101, 10))
+    assert requests[1] == (1000 - ETHERSCAN_FINALITY_DEPTH + 1, 1100)
+
+
+def test_returned_list_is_not_the_cache(monkeypatch):
+    client, requests = _client_with_chain(monkeypatch, [500])
+
+    client.get_normal_txs(ADDRESS, 0, 1000).clear()
+    assert [tx["blockNumber"] for tx in client.get_normal_txs(ADDRESS, 0, 1000)] == ["500"]
+
+
+def test_window_before_cached_segment_refetches(monkeypatch):
+    client, requests = _client_with_chain(monkeypatch, [50, 500])
+
+    client.get_normal_txs(ADDRESS, 100, 1000)
+    txs = client.get_normal_txs(ADDRESS, 0, 1000)
+    assert [tx["blockNumber"] for tx in txs] == ["50", "500"]
+    assert requests[-1] == (0, 1000)
@@ -0,0 +1,49 @@
+# backend/tests/test_log_scanner.py
+
+import threading
+from types import SimpleNamespace
+
+from log_scanner import scan_log_ranges
+
+
+def _fake_w3(logs_per_block: float):
+    requests = []
+    lock = threading.Lock()
+
+    def get_logs(params):
+        lo, hi = params["fromBlock"], params["toBlock"]
+        with lock:
+            requests.append((lo, hi))
+        return [{"blockNumber": lo}] * int((hi - lo + 1) * logs_per_block)
+
+    return SimpleNamespace(eth=SimpleNamespace(get_logs=get_logs)), requests
+
+
+def test_scan_log_ranges_keeps_density_across_ranges():
+    w3, requests = _fake_w3(0.01)
+    ranges = [(0, 999), (5_000, 5_000 + 400_000 - 1)]
+    seen = []
+
+    failed = scan_log_ranges(
+        w3,
+        {},
+        ranges,
+        on_range=lambda lo, hi, part: seen.append((lo, hi)),
+        workers=1,
+        initial_step=1_000,
+        max_step=100_000,
+        target_logs=500,
+    )
+
+    assert failed == []
+    # 子区间不跨越输入区间，且恰好覆盖所有输入区间
+    assert sorted(seen) == sorted(requests)
+    covered = sum(hi - lo + 1 for lo, hi in seen)
+    assert covered == sum(hi - lo + 1 for lo, hi in ranges)
+    for lo, hi in seen:
+        assert any(r_lo <= lo and hi <= r_hi for r_lo, r_hi in ranges)
+
+    # 第二段一开始就用第一段学到的密度（500 / 0.01 = 50000），而不是回到 initial_step
+    second = [r for r in requests if r[0] >= 5_000]
+    assert second[0] == (5_000, 5_000 + 50_000 - 1)
+
@@ -0,0 +1,158 @@
+# backend/tests/test_monitor.py
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import monitor
+from db import MonitorDatabase
+from trades import TradeBatch
+
+PAIR = "0x" + "11" * 20
+
+
+def test_timed_out_swap_fetch_writes_nothing_and_is_reused(tmp_path, monkeypatch):
+    db = MonitorDatabase(tmp_path / "monitor.db")
+    release = threading.Event()
+    fetch_calls = []
+
+    def slow_fetch(pair, from_block, to_block, network="mainnet"):
+        fetch_calls.append((from_block, to_block))
+        release.wait(5)
+        batch = TradeBatch()
+        batch.append(to_block, 0, "0x" + "aa" * 32, "token0", 10, 20, log_index=0)
+        return batch, [{"block_number": to_block, "reserve0": 10**18, "reserve1": 10**18}]
+
+    monkeypatch.setattr(monitor, "make_web3", lambda network: SimpleNamespace(eth=SimpleNamespace(block_number=1000)))
+    monkeypatch.setattr(monitor, "fetch_pair_logs_range", slow_fetch)
+    monkeypatch.setattr(monitor, "send_update_risk_tx", lambda *a, **k: "0x00")
+    monkeypatch.setitem(monitor.RISK_CONFIG, "factor_timeouts", {"swaps": 0.2, "whale_cex": 5})
+
+    state = monitor.init_market_state({"label": "TEST/WETH", "pairAddress": PAIR}, 60, 100)
+    tick_cache = {("reserves", "mainnet"): {PAIR: {"reserve0": 10**18, "reserve1": 10**18}}}
+
+    # 第一轮：抓取超时，本轮按 0 处理，游标不动
+    monitor.run_market_round(db, None, None, state, frozenset(), frozenset(), tick_cache)
+    assert db.get_ingest_cursor(PAIR) is None
+    assert state["swap_fetch"] is not None
+
+    # 超时的线程在轮次之间跑完，也不会自己写库
+    release.set()
+    state["swap_fetch"].result(timeout=5)
+    assert db.get_ingest_cursor(PAIR) is None
+
+    # 第二轮：复用上一轮还没消费的结果，不再重新抓；由调用线程落库
+    monitor.run_market_round(db, None, None, state, frozenset(), frozenset(), tick_cache)
+    assert fetch_calls == [(900, 1000)]
+    assert db.get_ingest_cursor(PAIR) == 1000
+    assert db.load_trade_window(PAIR, 900) == (10, 1)
+    assert state["swap_fetch"] is None
+
+
+def test_liquidity_rpc_is_a_timed_factor_outside_the_transaction(tmp_path, monkeypatch):
+    db = MonitorDatabase(tmp_path / "monitor.db")
+    release = threading.Event()
+    in_transaction = []
+
+    def slow_liquidity(pair, network="mainnet"):
+        in_transaction.append(db.conn.in_transaction)
+        release.wait(5)
+        return 123
+
+    monkeypatch.setattr(monitor, "make_web3", lambda network: SimpleNamespace(eth=SimpleNamespace(block_number=1000)))
+    monkeypatch.setattr(monitor, "fetch_pair_logs_range", lambda *a, **k: (TradeBatch(), []))
+    monkeypatch.setattr(monitor, "estimate_pool_liquidity", slow_liquidity)
+    monkeypatch.setattr(monitor, "send_update_risk_tx", lambda *a, **k: "0x00")
+    monkeypatch.setitem(monitor.RISK_CONFIG, "factor_timeouts", {"swaps": 5, "whale_cex": 5, "liquidity": 0.2})
+
+    state = monitor.init_market_state({"label": "TEST/WETH", "pairAddress": PAIR}, 60, 100)
+    try:
+        monitor.run_market_round(db, None, None, state, frozenset(), frozenset(), {})
+    finally:
+        release.set()
+
+    assert in_transaction == [False]
+    row = db.conn.execute("SELECT pool_liquidity FROM risk_metrics").fetchone()
+    assert row[0] in ("0", 0)
+
+
+def test_non_mainnet_market_fetches_on_its_own_network(tmp_path, monkeypatch):
+    db = MonitorDatabase(tmp_path / "monitor.db")
+    networks = []
+
+    def fake_make_web3(network):
+        networks.append(network)
+        return SimpleNamespace(eth=SimpleNamespace(block_number=1000))
+
+    def fake_fetch(pair, from_block, to_block, network="mainnet"):
+        networks.append(network)
+        return TradeBatch(), []
+
+    def fake_liquidity(pair, network="mainnet"):
+        networks.append(network)
+        return 7
+
+    monkeypatch.setattr(monitor, "make_web3", fake_make_web3)
+    monkeypatch.setattr(monitor, "fetch_pair_logs_range", fake_fetch)
+    monkeypatch.setattr(monitor, "estimate_pool_liquidity", fake_liquidity)
+    monkeypatch.setattr(monitor, "fetch_whale_cex_metrics", lambda **k: pytest.fail("主网以外不查 Etherscan"))
+    monkeypatch.setattr(monitor, "send_update_risk_tx", lambda *a, **k: "0x00")
+
+    state = monitor.init_market_state(
+        {"label": "TEST/SEPOLIA", "pairAddress": PAIR, "network": "sepolia"}, 60, 100
+    )
+    monitor.run_market_round(db, None, None, state, frozenset({"0x" + "33" * 20}), frozenset({"0x" + "44" * 20}), {})
+
+    assert set(networks) == {"sepolia"}
+    assert db.conn.execute("SELECT pool_liquidity FROM risk_metrics").fetchone()[0] in ("7", 7)
+
+
+def test_rank_engine_only_sees_committed_rounds(tmp_path, monkeypatch):
+    db = MonitorDatabase(tmp_path / "monitor.db")
+    monkeypatch.setattr(monitor, "_rank_engines", {})
+    monkeypatch.setattr(monitor, "make_web3", lambda network: SimpleNamespace(eth=SimpleNamespace(block_number=1000)))
+    monkeypatch.setattr(monitor, "fetch_pair_logs_range", lambda *a, **k: (TradeBatch(), []))
+    monkeypatch.setattr(monitor, "estimate_pool_liquidity", lambda *a, **k: 1)
+    monkeypatch.setattr(monitor, "send_update_risk_tx", lambda *a, **k: "0x00")
+
+    state = monitor.init_market_state({"label": "TEST/WETH", "pairAddress": PAIR}, 60, 100)
+    key = (state["market_id_hex"], monitor.RISK_CONFIG["history_window"])
+
+    save_risk_level = db.save_risk_level
+    fail = [True]
+
+    def flaky_save(**kwargs):
+        if fail[0]:
+            raise RuntimeError("disk full")
+        return save_risk_level(**kwargs)
+
+    # 事务回滚：库里没有这一轮，引擎里也不能有
+    monkeypatch.setattr(db, "save_risk_level", flaky_save)
+    with pytest.raises(RuntimeError):
+        monitor.run_market_round(db, None, None, state, frozenset(), frozenset(), {})
+    assert db.conn.execute("SELECT COUNT(*) FROM risk_metrics").fetchone()[0] == 0
+    assert len(monitor._rank_engines[key]) == 0
+
+    # 提交成功后才 push
+    fail[0] = False
+    monitor.run_market_round(db, None, None, state, frozenset(), frozenset(), {})
+    assert db.conn.execute("SELECT COUNT(*) FROM risk_metrics").fetchone()[0] == 1
+    assert len(monitor._rank_engines[key]) == 1
+
+
+def test_removed_market_releases_its_rank_engine(monkeypatch):
+    keep = monitor.init_market_state({"label": "KEEP/WETH", "pairAddress": PAIR}, 60, 100)
+    drop = monitor.init_market_state({"label": "DROP/WETH", "pairAddress": "0x" + "22" * 20}, 60, 100)
+    monkeypatch.setattr(monitor, "_rank_engines", {
+        (keep["market_id_hex"], 500): object(),
+        (drop["market_id_hex"], 500): object(),
+        (drop["market_id_hex"], 100): object(),
+    })
+    markets = [{"label": "KEEP/WETH", "type": "dex", "pairAddress": PAIR}]
+    monkeypatch.setattr(monitor, "get_dex_markets", lambda markets, labels: markets)
+
+    synced = monitor.sync_market_states([keep, drop], markets, None, 60, 100)
+
+    assert synced == [keep]
+    assert list(monitor._rank_engines) == [(keep["market_id_hex"], 500)]
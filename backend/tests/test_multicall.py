@@ -0,0 +1,73 @@
+# backend/tests/test_multicall.py
+"""
+fetch_pool_reserves 对本地 Hardhat 链的集成测试（contracts/test 下的替身合约）。
+先在仓库根目录：
+    npx hardhat compile
+    npx hardhat node
+节点地址用 HARDHAT_RPC_URL 覆盖（默认 http://127.0.0.1:8545）；
+没有编译产物或连不上节点时跳过。
+"""
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+from web3 import Web3
+
+import multicall
+
+ARTIFACTS_DIR = Path(__file__).resolve().parents[2] / "artifacts" / "contracts" / "test"
+HARDHAT_RPC_URL = os.getenv("HARDHAT_RPC_URL", "http://127.0.0.1:8545")
+
+
+def _artifact(source: str, name: str) -> dict:
+    path = ARTIFACTS_DIR / source / f"{name}.json"
+    if not path.exists():
+        pytest.skip(f"缺少编译产物 {path}，先运行 npx hardhat compile")
+    return json.loads(path.read_text())
+
+
+@pytest.fixture
+def hardhat_w3():
+    w3 = Web3(Web3.HTTPProvider(HARDHAT_RPC_URL, request_kwargs={"timeout": 5}))
+    try:
+        connected = w3.is_connected()
+    except Exception:
+        connected = False
+    if not connected:
+        pytest.skip(f"连不上 Hardhat 节点 {HARDHAT_RPC_URL}，先运行 npx hardhat node")
+    w3.eth.default_account = w3.eth.accounts[0]
+    return w3
+
+
+def _deploy(w3: Web3, source: str, name: str, *args) -> str:
+    artifact = _artifact(source, name)
+    factory = w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"])
+    receipt = w3.eth.wait_for_transaction_receipt(factory.constructor(*args).transact())
+    return receipt["contractAddress"]
+
+
+def test_fetch_pool_reserves_skips_reverting_pair(hardhat_w3, monkeypatch):
+    mc = _deploy(hardhat_w3, "Multicall3.sol", "Multicall3")
+    token0 = _deploy(hardhat_w3, "StubPair.sol", "StubToken", 18)
+    token1 = _deploy(hardhat_w3, "StubPair.sol", "StubToken", 6)
+    good = _deploy(hardhat_w3, "StubPair.sol", "StubPair", token0, token1, 2**112 - 1, 12_345)
+    bad = _deploy(hardhat_w3, "StubPair.sol", "RevertingPair")
+
+    monkeypatch.setattr(multicall, "MULTICALL3_ADDRESS", mc)
+    monkeypatch.setattr(multicall, "make_web3", lambda network: hardhat_w3)
+    monkeypatch.setattr(multicall, "_pair_meta_cache", {})
+    monkeypatch.setattr(multicall, "_reserves_cache", multicall.LRU(maxsize=16))
+
+    # allowFailure：RevertingPair 的 token0 / getReserves 都 revert，整批调用不受影响
+    out = multicall.fetch_pool_reserves([good, bad], network="hardhat")
+
+    assert set(out) == {good.lower()}
+    pool = out[good.lower()]
+    assert pool["reserve0"] == 2**112 - 1
+    assert pool["reserve1"] == 12_345
+    assert pool["token0"] == token0
+    assert pool["token1"] == token1
+    assert (pool["decimals0"], pool["decimals1"]) == (18, 6)
+    assert pool["block_number"] == hardhat_w3.eth.block_number
@@ -0,0 +1,55 @@
+# backend/tests/test_onchain_cache.py
+
+from types import SimpleNamespace
+
+import onchain_cache
+from onchain_cache import OnchainRiskCache
+
+MARKET = b"\x01" * 32
+
+
+class _FakeContract:
+    address = "0x" + "55" * 20
+
+    def __init__(self):
+        self.calls = 0
+        self.functions = SimpleNamespace(markets=self._markets)
+
+    def _markets(self, market_id):
+        def call():
+            self.calls += 1
+            return (2, 1700000000, True)
+        return SimpleNamespace(call=call)
+
+
+def _make_cache(block_number=100):
+    eth = SimpleNamespace(block_number=block_number, get_logs=lambda params: [])
+    contract = _FakeContract()
+    cache = OnchainRiskCache(SimpleNamespace(eth=eth), contract)
+    # 测试里手动驱动 _poll_once，不起后台线程
+    cache._watcher = object()
+    return cache, eth, contract
+
+
+def test_first_poll_keeps_entries_and_sets_watermark():
+    cache, eth, contract = _make_cache()
+    assert cache.get(MARKET)["level"] == 2
+
+    cache._poll_once()
+    assert cache._last_block == 100
+
+    cache.get(MARKET)
+    assert contract.calls == 1
+
+
+def test_falling_too_far_behind_invalidates():
+    cache, eth, contract = _make_cache()
+    cache.get(MARKET)
+    cache._poll_once()
+
+    eth.block_number = 100 + onchain_cache.MAX_LOG_SCAN_BLOCKS + 1
+    cache._poll_once()
+    assert cache._last_block == eth.block_number
+
+    cache.get(MARKET)
+    assert contract.calls == 2
@@ -0,0 +1,38 @@
+# backend/tests/test_risk_stream.py
+
+import json
+
+from db import MonitorDatabase, ReadOnlyDatabase
+from risk_stream import RiskStreamHub
+
+MARKET_A = "aa" * 32
+MARKET_B = "bb" * 32
+
+
+def _events(chunks):
+    out = []
+    for chunk in chunks:
+        lines = dict(line.split(": ", 1) for line in chunk.strip().splitlines() if ": " in line)
+        if lines.get("event") == "risk":
+            out.append(json.loads(lines["data"])["market_id"])
+    return out
+
+
+def test_stream_replay_and_live_events_are_filtered_by_market(tmp_path):
+    path = tmp_path / "monitor.db"
+    db = MonitorDatabase(path)
+    for market in (MARKET_A, MARKET_B, MARKET_A):
+        db.save_risk_level(market_id=market, level=1, source="test")
+
+    hub = RiskStreamHub(ReadOnlyDatabase(path), heartbeat=0.05)
+    gen = hub.stream(last_event_id=0, market_id="0x" + MARKET_A.upper())
+
+    chunks = [next(gen)]  # retry 行
+    chunks += [next(gen), next(gen)]
+    assert _events(chunks) == [MARKET_A, MARKET_A]
+
+    # 实时推送：别的市场的行不会进这个连接的队列
+    hub.publish("risk", {"market_id": MARKET_B}, 10, market_id=MARKET_B)
+    hub.publish("risk", {"market_id": MARKET_A}, 11, market_id=MARKET_A)
+    assert _events([next(gen)]) == [MARKET_A]
+    gen.close()
@@ -0,0 +1,74 @@
+# backend/tests/test_rolling_rank.py
+
+import random
+
+from rolling_rank import MetricsRankEngine, RollingPercentile, quantize
+
+
+def brute_force_rank(window, value):
+    """原来每轮排序的 percentile_rank：窗口中 <= value 的比例 * 100。"""
+    if not window:
+        return 50.0
+    return sum(1 for v in window if v <= value) / len(window) * 100.0
+
+
+def test_small_integers_match_brute_force_exactly():
+    rng = random.Random(7)
+    rp = RollingPercentile(50)
+    history = []
+    for _ in range(500):
+        v = rng.randint(-1000, 1000)
+        rp.push(v)
+        history = (history + [v])[-50:]
+        probe = rng.randint(-1100, 1100)
+        assert rp.rank(probe) == brute_force_rank(history, probe)
+        assert len(rp) == len(history)
+
+
+def test_rank_with_equals_rank_after_push():
+    rng = random.Random(11)
+    rp = RollingPercentile(20)
+    history = []
+    for _ in range(200):
+        v = rng.randint(0, 500)
+        expected = brute_force_rank((history + [v])[-20:], v)
+        assert rp.rank_with(v) == expected
+        rp.push(v)
+        history = (history + [v])[-20:]
+        assert rp.rank(v) == expected
+
+
+def test_large_values_stay_within_quantization_error():
+    rng = random.Random(3)
+    rp = RollingPercentile(100)
+    history = []
+    for _ in range(300):
+        v = rng.randint(0, 10**24)
+        rp.push(v)
+        history = (history + [v])[-100:]
+    for probe in history:
+        # 量化只会把相差 < 2^-(QUANT_BITS-1) 的值并到同一桶，排名只会偏高不会偏低
+        lo = brute_force_rank(history, probe)
+        hi = brute_force_rank(history, probe + (probe >> 9))
+        assert lo <= rp.rank(probe) <= hi
+
+
+def test_quantize_is_monotonic():
+    values = sorted({0, 1, -1, 1023, 1024, -1024, 10**18, -(10**18), 2**256 - 1, 2**300})
+    indexes = [quantize(v) for v in values]
+    assert indexes == sorted(indexes)
+
+
+def test_empty_window_ranks_at_median():
+    assert RollingPercentile(10).rank(123) == 50.0
+    assert RollingPercentile(10).rank_with(123) == 100.0
+
+
+def test_engine_warm_and_pending_length():
+    engine = MetricsRankEngine(3)
+    engine.warm([{"dex_volume": i, "dex_trades": i} for i in range(5)])
+    assert len(engine) == 3
+    assert engine.len_with_pending() == 3
+    # 窗口里是 2,3,4；再来一个 3 会挤掉 2 → 3,4,3
+    assert engine.rank_with("dex_volume", 3) == brute_force_rank([3, 4, 3], 3)
+    assert engine.rank("whale_sell_total", 0) == 100.0
@@ -0,0 +1,41 @@
+# backend/tests/test_whale_cex.py
+
+from types import SimpleNamespace
+
+import pytest
+
+import whale_cex
+
+CEX_A = "0x" + "aa" * 20
+CEX_B = "0x" + "bb" * 20
+
+
+def test_etherscan_failure_fails_the_whole_factor(monkeypatch):
+    def get_normal_txs(address, start_block, end_block):
+        if address.lower() == CEX_B:
+            raise RuntimeError("rate limited")
+        return [{"from": "0x" + "11" * 20, "to": CEX_A, "value": "5"}]
+
+    monkeypatch.setattr(whale_cex, "make_web3", lambda network: SimpleNamespace(eth=SimpleNamespace(block_number=1000)))
+    monkeypatch.setattr(whale_cex, "get_etherscan_client", lambda: SimpleNamespace(get_normal_txs=get_normal_txs))
+
+    # 不能只把 CEX_A 的 5 wei 当成净流入返回
+    with pytest.raises(RuntimeError):
+        whale_cex.fetch_whale_cex_metrics(whales=[], cex_addresses=[CEX_A, CEX_B], blocks_back=100)
+
+
+def test_checksummed_whale_frozenset_still_matches(monkeypatch):
+    whale = "0x" + "cd" * 20
+    txs = [{"from": whale, "to": CEX_A, "value": "7"}]
+
+    monkeypatch.setattr(whale_cex, "make_web3", lambda network: SimpleNamespace(eth=SimpleNamespace(block_number=1000)))
+    monkeypatch.setattr(
+        whale_cex, "get_etherscan_client", lambda: SimpleNamespace(get_normal_txs=lambda *a: txs)
+    )
+
+    result = whale_cex.fetch_whale_cex_metrics(
+        whales=frozenset({whale_cex.Web3.to_checksum_address(whale)}),
+        cex_addresses=[CEX_A],
+        blocks_back=100,
+    )
+    assert result[:2] == (7, 1)
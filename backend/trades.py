@@ -0,0 +1,169 @@
+# backend/trades.py
+"""
+列式的 Swap 成交批次，替代 9 个 key 的 dict 列表。
+
+- block_number / timestamp / side 用 array 紧凑存储
+- 金额是 uint256，可能超过 int64，所以 amount_in / amount_out 保持 Python int 列表（精确）
+- 提供 sum / count / filter 这类整列操作，消费方不用再逐条拆 dict
+"""
+
+from __future__ import annotations
+
+from array import array
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Union
+
+TOKEN_NAMES = ("token0", "token1")
+
+
+class TradeBatch:
+    __slots__ = (
+        "block_number",
+        "timestamp",
+        "side",        # 0: token0 -> token1, 1: token1 -> token0
+        "tx_hash",
+        "log_index",   # 日志在区块内的序号；同一 tx 的多个 Swap 靠它区分
+        "amount_in",
+        "amount_out",
+        "gas_used",
+        "gas_price",
+    )
+
+    def __init__(self):
+        self.block_number = array("q")
+        self.timestamp = array("q")
+        self.side = array("B")
+        self.tx_hash: List[str] = []
+        self.log_index = array("q")
+        self.amount_in: List[int] = []
+        self.amount_out: List[int] = []
+        self.gas_used: List[int] = []
+        self.gas_price: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.tx_hash)
+
+    # ------------------------------------------------------------------
+    # 构造
+    # ------------------------------------------------------------------
+    def append(
+        self,
+        block_number: int,
+        timestamp: int,
+        tx_hash: str,
+        token_in: str,
+        amount_in: int,
+        amount_out: int,
+        gas_used: int = 0,
+        gas_price: int = 0,
+        log_index: int = 0,
+    ):
+        self.block_number.append(int(block_number))
+        self.timestamp.append(int(timestamp))
+        self.side.append(0 if token_in == "token0" else 1)
+        self.tx_hash.append(tx_hash)
+        self.log_index.append(int(log_index))
+        self.amount_in.append(int(amount_in))
+        self.amount_out.append(int(amount_out))
+        self.gas_used.append(int(gas_used))
+        self.gas_price.append(int(gas_price))
+
+    @classmethod
+    def from_dicts(cls, trades: Iterable[Dict[str, Any]]) -> "TradeBatch":
+        batch = cls()
+        for t in trades:
+            batch.append(
+                block_number=t["block_number"],
+                timestamp=t["timestamp"],
+                tx_hash=t["tx_hash"],
+                token_in=t["token_in"],
+                amount_in=t["amount_in"],
+                amount_out=t["amount_out"],
+                gas_used=t.get("gas_used", 0) or 0,
+                gas_price=t.get("gas_price", 0) or 0,
+                log_index=t.get("log_index", 0) or 0,
+            )
+        return batch
+
+    @classmethod
+    def from_swap_columns(cls, swaps: Dict[str, List[Any]], block_ts: Dict[int, int]) -> "TradeBatch":
+        """由 chain_data.decode_swap_logs 的列式结果构造：amount0_in > 0 视为 token0 -> token1。"""
+        batch = cls()
+        a0_in, a1_in = swaps["amount0_in"], swaps["amount1_in"]
+        a0_out, a1_out = swaps["amount0_out"], swaps["amount1_out"]
+
+        batch.block_number = array("q", swaps["block_number"])
+        batch.timestamp = array("q", (block_ts[b] for b in swaps["block_number"]))
+        batch.side = array("B", (0 if a > 0 else 1 for a in a0_in))
+        batch.tx_hash = list(swaps["tx_hash"])
+        batch.log_index = array("q", swaps["log_index"])
+        batch.amount_in = [a0 if a0 > 0 else a1 for a0, a1 in zip(a0_in, a1_in)]
+        batch.amount_out = [o1 if a0 > 0 else o0 for a0, o0, o1 in zip(a0_in, a0_out, a1_out)]
+        batch.gas_used = [0] * len(batch.tx_hash)
+        batch.gas_price = [0] * len(batch.tx_hash)
+        return batch
+
+    # ------------------------------------------------------------------
+    # 整列操作
+    # ------------------------------------------------------------------
+    def total_amount_in(self) -> int:
+        return sum(self.amount_in)
+
+    def total_amount_out(self) -> int:
+        return sum(self.amount_out)
+
+    def filter(self, mask: Iterable[bool]) -> "TradeBatch":
+        idx = [i for i, keep in enumerate(mask) if keep]
+        out = TradeBatch()
+        out.block_number = array("q", (self.block_number[i] for i in idx))
+        out.timestamp = array("q", (self.timestamp[i] for i in idx))
+        out.side = array("B", (self.side[i] for i in idx))
+        out.tx_hash = [self.tx_hash[i] for i in idx]
+        out.log_index = array("q", (self.log_index[i] for i in idx))
+        out.amount_in = [self.amount_in[i] for i in idx]
+        out.amount_out = [self.amount_out[i] for i in idx]
+        out.gas_used = [self.gas_used[i] for i in idx]
+        out.gas_price = [self.gas_price[i] for i in idx]
+        return out
+
+    def since_block(self, from_block: int) -> "TradeBatch":
+        return self.filter(b >= from_block for b in self.block_number)
+
+    def side_count(self, side: int) -> int:
+        return self.side.count(side)
+
+    # ------------------------------------------------------------------
+    # 导出：落库用元组 / 兼容旧代码的 dict
+    # ------------------------------------------------------------------
+    def db_rows(self) -> Iterator[Tuple[str, int, int, str, str, int, int, int, int, int]]:
+        """(tx_hash, timestamp, block_number, token_in, token_out, amount_in, amount_out, gas_used, gas_price, log_index)"""
+        for i in range(len(self.tx_hash)):
+            side = self.side[i]
+            yield (
+                self.tx_hash[i],
+                self.timestamp[i],
+                self.block_number[i],
+                TOKEN_NAMES[side],
+                TOKEN_NAMES[1 - side],
+                self.amount_in[i],
+                self.amount_out[i],
+                self.gas_used[i],
+                self.gas_price[i],
+                self.log_index[i],
+            )
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        keys = (
+            "tx_hash", "timestamp", "block_number", "token_in", "token_out",
+            "amount_in", "amount_out", "gas_used", "gas_price", "log_index",
+        )
+        return [dict(zip(keys, row)) for row in self.db_rows()]
+
+
+TradesLike = Union[TradeBatch, List[Dict[str, Any]]]
+
+
+def as_trade_batch(trades: TradesLike) -> TradeBatch:
+    """生产方 / 消费方统一入口：dict 列表会被转换，TradeBatch 原样返回。"""
+    if isinstance(trades, TradeBatch):
+        return trades
+    return TradeBatch.from_dicts(trades)
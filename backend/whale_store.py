@@ -0,0 +1,193 @@
+# backend/whale_store.py
+"""
+collect_eth_whales 的断点续扫存储（SQLite，默认 backend/whale_scan.db）：
+  - scan_chunks : 每个 token 已经扫完的区块区间
+  - chunk_stats : 每个区间内按地址聚合好的 volume / tx_count（不存原始日志）
+
+区间按 SEGMENT_BLOCKS 对齐切分，一个区间扫完就在一个事务里整体落盘；
+中途崩溃最多丢掉正在扫的那一段，重启后只补扫缺口。
+滚动窗口：窗口起点之前的区间直接删除，新区块只扫 [上次扫到的区块 + 1, 最新区块]。
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from db import apply_pragmas
+
+WHALE_SCAN_DB_PATH = Path(__file__).resolve().parent / "whale_scan.db"
+
+# 检查点粒度：缺口按这个区块数对齐切段，每段扫完保存一次
+SEGMENT_BLOCKS = 10_000
+
+# (from_block, to_block)，闭区间
+BlockRange = Tuple[int, int]
+
+
+def plan_missing_ranges(
+    covered: List[BlockRange],
+    start_block: int,
+    end_block: int,
+    segment: int = SEGMENT_BLOCKS,
+) -> List[BlockRange]:
+    """[start_block, end_block] 里还没被 covered 覆盖的部分，按 segment 边界切段。"""
+    gaps: List[BlockRange] = []
+    cursor = start_block
+    for lo, hi in sorted(covered):
+        if hi < cursor:
+            continue
+        if lo > end_block:
+            break
+        if lo > cursor:
+            gaps.append((cursor, lo - 1))
+        cursor = max(cursor, hi + 1)
+    if cursor <= end_block:
+        gaps.append((cursor, end_block))
+
+    pieces: List[BlockRange] = []
+    for lo, hi in gaps:
+        while lo <= hi:
+            seg_end = min(hi, (lo // segment + 1) * segment - 1)
+            pieces.append((lo, seg_end))
+            lo = seg_end + 1
+    return pieces
+
+
+class WhaleScanStore:
+    def __init__(self, db_path: Path | str = WHALE_SCAN_DB_PATH):
+        self.db_path = str(db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        apply_pragmas(self.conn)
+        self.create_tables()
+
+    def create_tables(self):
+        with self.conn:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS scan_chunks (
+                    token TEXT NOT NULL,          -- checksum 地址
+                    from_block INTEGER NOT NULL,
+                    to_block INTEGER NOT NULL,
+                    log_count INTEGER NOT NULL,
+                    scanned_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (token, from_block)
+                )
+                """
+            )
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunk_stats (
+                    token TEXT NOT NULL,
+                    from_block INTEGER NOT NULL,  -- 所属 scan_chunks.from_block
+                    address BLOB NOT NULL,        -- 20 字节地址
+                    volume TEXT NOT NULL,         -- 大整数按字符串存
+                    tx_count INTEGER NOT NULL,
+                    PRIMARY KEY (token, from_block, address)
+                ) WITHOUT ROWID
+                """
+            )
+
+    # ------------------------------------------------------------------
+    # 区间检查点
+    # ------------------------------------------------------------------
+    def covered_ranges(self, token: str) -> List[BlockRange]:
+        return self.conn.execute(
+            "SELECT from_block, to_block FROM scan_chunks WHERE token = ? ORDER BY from_block",
+            (token,),
+        ).fetchall()
+
+    def save_chunk(
+        self,
+        token: str,
+        from_block: int,
+        to_block: int,
+        totals: Dict[bytes, List[int]],
+        log_count: int,
+    ):
+        """一个区间的地址聚合结果和区间本身在同一个事务里写入。"""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM chunk_stats WHERE token = ? AND from_block = ?",
+                (token, int(from_block)),
+            )
+            self.conn.executemany(
+                """
+                INSERT INTO chunk_stats (token, from_block, address, volume, tx_count)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [
+                    (token, int(from_block), addr, str(volume), int(count))
+                    for addr, (volume, count) in totals.items()
+                ],
+            )
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO scan_chunks (token, from_block, to_block, log_count)
+                VALUES (?, ?, ?, ?)
+                """,
+                (token, int(from_block), int(to_block), int(log_count)),
+            )
+
+    def prune(self, token: str, before_block: int) -> int:
+        """删除完全落在窗口起点之前的区间，返回删除的区间数。"""
+        with self.conn:
+            self.conn.execute(
+                """
+                DELETE FROM chunk_stats
+                WHERE token = ? AND from_block IN (
+                    SELECT from_block FROM scan_chunks WHERE token = ? AND to_block < ?
+                )
+                """,
+                (token, token, int(before_block)),
+            )
+            cur = self.conn.execute(
+                "DELETE FROM scan_chunks WHERE token = ? AND to_block < ?",
+                (token, int(before_block)),
+            )
+        return cur.rowcount
+
+    def clear(self, token: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM chunk_stats WHERE token = ?", (token,))
+            self.conn.execute("DELETE FROM scan_chunks WHERE token = ?", (token,))
+
+    # ------------------------------------------------------------------
+    # 窗口内汇总
+    # ------------------------------------------------------------------
+    def load_window(self, token: str, from_block: int, to_block: int) -> Tuple[Dict[bytes, List[int]], int]:
+        """
+        把与 [from_block, to_block] 有交集的区间合并成 address -> [volume, tx_count]。
+        窗口边缘按区间粒度取整（最多多算一个 SEGMENT_BLOCKS）。返回 (totals, log_count)。
+        """
+        chunks = self.conn.execute(
+            """
+            SELECT from_block, log_count FROM scan_chunks
+            WHERE token = ? AND to_block >= ? AND from_block <= ?
+            """,
+            (token, int(from_block), int(to_block)),
+        ).fetchall()
+
+        totals: Dict[bytes, List[int]] = {}
+        log_count = 0
+        for chunk_from, chunk_logs in chunks:
+            log_count += chunk_logs
+            rows = self.conn.execute(
+                "SELECT address, volume, tx_count FROM chunk_stats WHERE token = ? AND from_block = ?",
+                (token, chunk_from),
+            )
+            for addr, volume, count in rows:
+                acc = totals.get(addr)
+                if acc is None:
+                    totals[addr] = [int(volume), count]
+                else:
+                    acc[0] += int(volume)
+                    acc[1] += count
+        return totals, log_count
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
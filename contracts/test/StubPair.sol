@@ -0,0 +1,56 @@
+// contracts/test/StubPair.sol
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.20;
+
+/**
+ * @dev 仅供测试：backend/multicall.py 的 fetch_pool_reserves 在本地链上的替身合约
+ * - StubToken    ：只有 decimals()
+ * - StubPair     ：Uniswap V2 pair 的只读接口 getReserves / token0 / token1，储备可随时改
+ * - RevertingPair：所有调用都 revert，用来验证 Multicall3 allowFailure
+ */
+contract StubToken {
+    uint8 public decimals;
+
+    constructor(uint8 _decimals) {
+        decimals = _decimals;
+    }
+}
+
+contract StubPair {
+    address public token0;
+    address public token1;
+
+    uint112 private reserve0;
+    uint112 private reserve1;
+    uint32 private blockTimestampLast;
+
+    constructor(address _token0, address _token1, uint112 _reserve0, uint112 _reserve1) {
+        token0 = _token0;
+        token1 = _token1;
+        setReserves(_reserve0, _reserve1);
+    }
+
+    function setReserves(uint112 _reserve0, uint112 _reserve1) public {
+        reserve0 = _reserve0;
+        reserve1 = _reserve1;
+        blockTimestampLast = uint32(block.timestamp);
+    }
+
+    function getReserves() external view returns (uint112, uint112, uint32) {
+        return (reserve0, reserve1, blockTimestampLast);
+    }
+}
+
+contract RevertingPair {
+    function token0() external pure returns (address) {
+        revert("RevertingPair: token0");
+    }
+
+    function token1() external pure returns (address) {
+        revert("RevertingPair: token1");
+    }
+
+    function getReserves() external pure returns (uint112, uint112, uint32) {
+        revert("RevertingPair: getReserves");
+    }
+}